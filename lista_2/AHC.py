@@ -1,66 +1,154 @@
+import os
 import math
 import argparse
+import itertools
+import collections
+import functools
+import heapq
+from concurrent.futures import ProcessPoolExecutor
 
 KOD_NYT = 'NYT'
+ROZMIAR_BLOKU = 1 << 16
+BITY_TABLICY_DEKODOWANIA = 8
+MAGIC_KONTENERA = b'AHCB'
+ROZMIAR_BLOKU_KONTENERA = 1 << 20
+MAKS_LICZBA_WEZLOW = 2 * 256 + 1
+MAGIC_STATYCZNY = b'AHCS'
+MAGIC_MIGAWKI = b'AHCM'
+MAKS_DLUGOSC_KODU_STATYCZNEGO = 15
 
 class Wezel:
-    def __init__(self, rodzic, waga=0, lewy=None, prawy=None, znak=''):
-        self._rodzic = rodzic
-        self._waga = waga
-        self._lewy = lewy
-        self._prawy = prawy
-        self._znak = znak
+    # __slots__ zamiast słownika atrybutów: mniej pamięci i szybszy dostęp w pętlach kodowania
+    __slots__ = ('rodzic', 'waga', 'lewy', 'prawy', 'znak', 'numer', 'kod')
 
-    @property
-    def rodzic(self):
-        return self._rodzic
-    
-    @rodzic.setter
-    def rodzic(self, nowy_rodzic):
-        self._rodzic = nowy_rodzic
+    def __init__(self, rodzic, waga=0, lewy=None, prawy=None, znak='', numer=0):
+        self.rodzic = rodzic
+        self.waga = waga
+        self.lewy = lewy
+        self.prawy = prawy
+        self.znak = znak
+        self.numer = numer
+        self.kod = None  # zapamiętany kod węzła: (wartość, długość w bitach) lub None
 
-    @property
-    def waga(self):
-        return self._waga
-    
-    @waga.setter
-    def waga(self, nowa_waga):
-        self._waga = nowa_waga
+    def czy_lisc(self):
+        return self.lewy is None and self.prawy is None
+
+
+class KodowanieHuffmana:
+    SILNIK = 'fgk'
+
+    def __init__(self):
+        self._NYT = Wezel(None, 0, znak=KOD_NYT, numer=MAKS_LICZBA_WEZLOW - 1)
+        self._NYT.kod = (0, 0)
+        self._korzen = self._NYT
+        self._wszystkie_znaki = [None] * 256
+        # Numeracja FGK: wyższy numer -> wyżej w drzewie, wagi niemalejące wraz z numerem
+        self._wezly_wg_numeru = [None] * MAKS_LICZBA_WEZLOW
+        self._wezly_wg_numeru[self._NYT.numer] = self._NYT
+        # waga -> węzeł o najwyższym numerze w bloku tej wagi (lider bloku)
+        self._liderzy = {}
+        self._trafienia_kodow = 0
+        self._chybienia_kodow = 0
+        self._liczba_zamian = 0
+        # Tablica dekodowania i węzły przestawione od jej ostatniej aktualizacji
+        self._tablica_dekodowania = None
+        self._zmienione_wezly = []
 
     @property
-    def lewy(self):
-        return self._lewy
-    
-    @lewy.setter
-    def lewy(self, nowy_lewy):
-        self._lewy = nowy_lewy
+    def trafienia_kodow(self):
+        return self._trafienia_kodow
 
     @property
-    def prawy(self):
-        return self._prawy
-    
-    @prawy.setter
-    def prawy(self, nowy_prawy):
-        self._prawy = nowy_prawy
+    def chybienia_kodow(self):
+        return self._chybienia_kodow
 
     @property
-    def znak(self):
-        return self._znak
-    
-    @znak.setter
-    def znak(self, nowy_znak):
-        self._znak = nowy_znak
+    def liczba_zamian(self):
+        return self._liczba_zamian
 
-    def czy_lisc(self):
-        return self._lewy is None and self._prawy is None
+    def zapisz_migawke(self):
+        """
+        Zapisuje stan modelu w postaci binarnej: MAGIC_MIGAWKI, nazwa silnika, liczba węzłów (2 B),
+        a dla każdego węzła od korzenia w dół numeracji: rodzaj (1 B), znak (1 B), waga (4 B)
+        i numer rodzica z bitem strony w najstarszym bicie (2 B, 0xFFFF dla korzenia).
+        """
+        wezly = [w for w in reversed(self._wezly_wg_numeru) if w is not None]
+        nazwa = self.SILNIK.encode()
+
+        wynik = bytearray(MAGIC_MIGAWKI)
+        wynik.append(len(nazwa))
+        wynik += nazwa
+        wynik += len(wezly).to_bytes(2, byteorder="big")
+        for wezel in wezly:
+            if wezel is self._NYT:
+                rodzaj, znak = 2, 0
+            elif wezel.znak:
+                rodzaj, znak = 1, ord(wezel.znak)
+            else:
+                rodzaj, znak = 0, 0
 
+            if wezel.rodzic is None:
+                rodzic = 0xFFFF
+            else:
+                rodzic = wezel.rodzic.numer | ((wezel.rodzic.prawy is wezel) << 15)
 
-class KodowanieHuffmana:
-    def __init__(self):
-        self._NYT = Wezel(None, 0, znak=KOD_NYT)
-        self._korzen = self._NYT
-        self._wszystkie_znaki = [None] * 256
-        self._posortowane_wezly = []
+            wynik.append(rodzaj)
+            wynik.append(znak)
+            wynik += wezel.waga.to_bytes(4, byteorder="big")
+            wynik += rodzic.to_bytes(2, byteorder="big")
+
+        return bytes(wynik)
+
+    @classmethod
+    def z_migawki(cls, dane):
+        """
+        Odtwarza model zapisany przez zapisz_migawke, np. wytrenowany na korpusie referencyjnym.
+        """
+        if dane[:len(MAGIC_MIGAWKI)] != MAGIC_MIGAWKI:
+            raise Exception("To nie jest migawka modelu AHC")
+        pozycja = len(MAGIC_MIGAWKI)
+        nazwa = dane[pozycja + 1:pozycja + 1 + dane[pozycja]].decode()
+        if nazwa != cls.SILNIK:
+            raise Exception(f"Migawka dotyczy silnika {nazwa}, a nie {cls.SILNIK}")
+        pozycja += 1 + len(nazwa)
+        liczba_wezlow = int.from_bytes(dane[pozycja:pozycja + 2], byteorder="big")
+        pozycja += 2
+
+        model = cls()
+        model._wezly_wg_numeru = [None] * MAKS_LICZBA_WEZLOW
+        for i in range(liczba_wezlow):
+            rodzaj = dane[pozycja]
+            znak = dane[pozycja + 1]
+            waga = int.from_bytes(dane[pozycja + 2:pozycja + 6], byteorder="big")
+            rodzic = int.from_bytes(dane[pozycja + 6:pozycja + 8], byteorder="big")
+            pozycja += 8
+
+            wezel = Wezel(None, waga, numer=MAKS_LICZBA_WEZLOW - 1 - i)
+            model._wezly_wg_numeru[wezel.numer] = wezel
+            if rodzaj == 2:
+                wezel.znak = KOD_NYT
+                model._NYT = wezel
+            elif rodzaj == 1:
+                wezel.znak = chr(znak)
+                model._wszystkie_znaki[znak] = wezel
+
+            # Rodzic ma wyższy numer, więc jest już odtworzony
+            if rodzic == 0xFFFF:
+                model._korzen = wezel
+                wezel.kod = (0, 0)
+            else:
+                wezel.rodzic = model._wezly_wg_numeru[rodzic & 0x7FFF]
+                if rodzic >> 15:
+                    wezel.rodzic.prawy = wezel
+                else:
+                    wezel.rodzic.lewy = wezel
+
+        model._odbuduj_liderow()
+        return model
+
+    def _odbuduj_liderow(self):
+        # Przy rosnących numerach ostatni węzeł danej wagi nadpisuje poprzednie
+        self._liderzy = {w.waga: w for w in self._wezly_wg_numeru if w is not None}
 
     def _czy_juz_dodany(self, znak):
         if ord(znak) > 255:
@@ -68,90 +156,232 @@ class KodowanieHuffmana:
 
         return self._wszystkie_znaki[ord(znak)] is not None
 
+    def _rozdziel_nyt(self, znak):
+        """
+        Zastępuje NYT węzłem wewnętrznym o jego numerze, z nowym NYT po lewej i liściem znaku po prawej.
+        Nowe węzły mają wagę 0 - ich zwiększenie należy do wywołującego.
+        :return: nowy węzeł wewnętrzny
+        """
+        nyt = self._NYT
+        stary_rodzic_nyt = nyt.rodzic
+        numer = nyt.numer
+
+        nowy_rodzic = Wezel(stary_rodzic_nyt, lewy=nyt, prawy=None, numer=numer)
+        nowy_rodzic.kod = nyt.kod
+        nyt.kod = None
+        if stary_rodzic_nyt is None:
+            self._korzen = nowy_rodzic
+        else:
+            stary_rodzic_nyt.lewy = nowy_rodzic
+        nyt.rodzic = nowy_rodzic
+        nyt.numer = numer - 2
+
+        nowy_wezel = Wezel(nowy_rodzic, znak=znak, numer=numer - 1)
+        nowy_rodzic.prawy = nowy_wezel
+
+        self._wezly_wg_numeru[numer] = nowy_rodzic
+        self._wezly_wg_numeru[numer - 1] = nowy_wezel
+        self._wezly_wg_numeru[numer - 2] = nyt
+        self._wszystkie_znaki[ord(znak)] = nowy_wezel
+        if self._tablica_dekodowania is not None:
+            self._zmienione_wezly.append(nowy_rodzic)
+
+        return nowy_rodzic
+
     def _zarejestruj_znak(self, znak):
         obecny = self._wszystkie_znaki[ord(znak)]
 
         if obecny is None:
-            nyt = self._NYT
-            stary_rodzic_nyt = nyt.rodzic
+            nowy_rodzic = self._rozdziel_nyt(znak)
+            nowy_rodzic.waga = 1
+            nowy_rodzic.prawy.waga = 1
+            self._liderzy[0] = self._NYT
+            if 1 not in self._liderzy:
+                self._liderzy[1] = nowy_rodzic
 
-            nowy_rodzic = None
+            obecny = nowy_rodzic.rodzic
 
-            if stary_rodzic_nyt is None:
-                self._korzen = Wezel(None, lewy=nyt, prawy=None)
-                nyt.rodzic = self._korzen
-                nowy_rodzic = self._korzen
-            else:
-                nowy_rodzic = Wezel(stary_rodzic_nyt, waga=1, lewy=nyt, prawy=None)
-                stary_rodzic_nyt.lewy = nowy_rodzic
-                nyt.rodzic = nowy_rodzic
+        while obecny is not None:
+            waga = obecny.waga
+            lider = self._liderzy[waga]
 
-            nowy_wezel = Wezel(nowy_rodzic, waga=1, znak=znak)
-            nowy_rodzic.prawy = nowy_wezel
+            if lider is obecny.rodzic:
+                # Rodzeństwo NYT: przesuwamy węzeł tuż pod rodzica i zwiększamy oba naraz
+                rodzic = lider
+                sasiad = self._wezly_wg_numeru[rodzic.numer - 1]
+                if sasiad is not obecny:
+                    self._zamien_wezly(obecny, sasiad)
 
-            self._posortowane_wezly.extend([nowy_wezel, nowy_rodzic])
-            self._wszystkie_znaki[ord(znak)] = nowy_wezel
+                ponizej = self._wezly_wg_numeru[obecny.numer - 1]
+                if ponizej.waga == waga:
+                    self._liderzy[waga] = ponizej
+                else:
+                    del self._liderzy[waga]
 
-            obecny = nowy_rodzic.rodzic
+                obecny.waga += 1
+                rodzic.waga += 1
+                if waga + 1 not in self._liderzy:
+                    self._liderzy[waga + 1] = rodzic
 
-        while obecny is not None:
-            do_zamiany = next(w for w in self._posortowane_wezly if w.waga == obecny.waga)
-            if obecny is not do_zamiany and obecny is not do_zamiany.rodzic and do_zamiany is not obecny.rodzic:
-                self._zamien_wezly(obecny, do_zamiany)
+                obecny = rodzic.rodzic
+                continue
+
+            if lider is not obecny:
+                self._zamien_wezly(obecny, lider)
+
+            # obecny jest teraz liderem swojego bloku - węzeł poniżej przejmuje przywództwo
+            ponizej = self._wezly_wg_numeru[obecny.numer - 1]
+            if ponizej is not None and ponizej.waga == waga:
+                self._liderzy[waga] = ponizej
+            else:
+                del self._liderzy[waga]
 
             obecny.waga += 1
+            if waga + 1 not in self._liderzy:
+                self._liderzy[waga + 1] = obecny
+
             obecny = obecny.rodzic
 
+    def _uniewaznij_kody(self, wezel):
+        # Węzły z ważnym kodem tworzą zbiór domknięty ku korzeniowi,
+        # więc poddrzewo z nieważnym korzeniem można pominąć
+        stos = [wezel]
+        while stos:
+            wezel = stos.pop()
+            if wezel is None or wezel.kod is None:
+                continue
+            wezel.kod = None
+            stos.append(wezel.lewy)
+            stos.append(wezel.prawy)
+
     def _zamien_wezly(self, jeden, dwa):
-        indeks_jeden = self._posortowane_wezly.index(jeden)
-        indeks_dwa = self._posortowane_wezly.index(dwa)
+        self._uniewaznij_kody(jeden)
+        self._uniewaznij_kody(dwa)
+        if self._tablica_dekodowania is not None:
+            if jeden.rodzic is dwa.rodzic:
+                # Rodzeństwo tylko zamienia się stronami - wystarczy przepisać zakres rodzica
+                self._zmienione_wezly.append(jeden.rodzic)
+            else:
+                self._zmienione_wezly.append(jeden)
+                self._zmienione_wezly.append(dwa)
 
-        self._posortowane_wezly[indeks_jeden], self._posortowane_wezly[indeks_dwa] = \
-            self._posortowane_wezly[indeks_dwa], self._posortowane_wezly[indeks_jeden]
+        self._liczba_zamian += 1
 
-        rodzic = jeden.rodzic
-        jeden.rodzic = dwa.rodzic
-        dwa.rodzic = rodzic
+        jeden.numer, dwa.numer = dwa.numer, jeden.numer
+        self._wezly_wg_numeru[jeden.numer] = jeden
+        self._wezly_wg_numeru[dwa.numer] = dwa
 
-        if jeden.rodzic.lewy is dwa:
-            jeden.rodzic.lewy = jeden
+        rodzic_jeden = jeden.rodzic
+        rodzic_dwa = dwa.rodzic
+        jeden_lewy = rodzic_jeden.lewy is jeden
+        dwa_lewy = rodzic_dwa.lewy is dwa
+
+        if jeden_lewy:
+            rodzic_jeden.lewy = dwa
         else:
-            jeden.rodzic.prawy = jeden
+            rodzic_jeden.prawy = dwa
 
-        if dwa.rodzic.lewy is jeden:
-            dwa.rodzic.lewy = dwa
+        if dwa_lewy:
+            rodzic_dwa.lewy = jeden
         else:
-            dwa.rodzic.prawy = dwa
+            rodzic_dwa.prawy = jeden
 
-    def _generuj_kod_wezla(self, _wezel):
-        kod = ''
-        wezel = _wezel
-        while wezel.rodzic is not None:
-            rodzic = wezel.rodzic
-            kod += '0' if rodzic.lewy is wezel else '1'
-            wezel = rodzic
-        return kod[::-1]
+        jeden.rodzic = rodzic_dwa
+        dwa.rodzic = rodzic_jeden
+
+    def _kod_wezla(self, wezel):
+        """
+        Zwraca kod węzła jako (wartość, długość w bitach), korzystając z zapamiętanych kodów.
+        Przy braku kodu idzie w górę do najbliższego przodka z ważnym kodem i uzupełnia ścieżkę.
+        """
+        kod = wezel.kod
+        if kod is not None:
+            self._trafienia_kodow += 1
+            return kod
+
+        self._chybienia_kodow += 1
+        sciezka = []
+        while wezel.kod is None:
+            sciezka.append(wezel)
+            wezel = wezel.rodzic
+
+        wartosc, dlugosc = wezel.kod
+        for wezel in reversed(sciezka):
+            wartosc = (wartosc << 1) | (wezel.rodzic.prawy is wezel)
+            dlugosc += 1
+            wezel.kod = (wartosc, dlugosc)
+
+        return wezel.kod
+
+    def _generuj_kod_wezla(self, wezel):
+        wartosc, dlugosc = self._kod_wezla(wezel)
+        return bin(wartosc)[2:].zfill(dlugosc) if dlugosc else ''
 
     def _generuj_kod(self, znak):
         if self._czy_juz_dodany(znak):
-            wezel = self._wszystkie_znaki[ord(znak)]
-            return self._generuj_kod_wezla(wezel)
+            return self._kod_wezla(self._wszystkie_znaki[ord(znak)])
         else:
-            return self._generuj_kod_wezla(self._NYT) + bin(ord(znak))[2:].zfill(8)
+            wartosc, dlugosc = self._kod_wezla(self._NYT)
+            return (wartosc << 8) | ord(znak), dlugosc + 8
 
-    def koduj_pojedynczy_znak(self, znak):
+    def koduj_pojedynczy_znak_bitowo(self, znak):
+        """
+        Koduje znak i aktualizuje model.
+        :return: (wartość kodu, długość kodu w bitach)
+        """
         kod = self._generuj_kod(znak)
         self._zarejestruj_znak(znak)
         return kod
 
+    def koduj_pojedynczy_znak(self, znak):
+        wartosc, dlugosc = self.koduj_pojedynczy_znak_bitowo(znak)
+        return bin(wartosc)[2:].zfill(dlugosc)
+
+    def koduj_strumien(self, bloki, zapisz):
+        """
+        Koduje kolejne bloki bajtów. Bity czekające na zapis trzymane są w akumulatorze (int),
+        pełne bajty są z niego zdejmowane na bieżąco i przekazywane do `zapisz` po każdym bloku.
+        Ostatni bajt jest dopełniany zerami.
+        :param bloki: iterowalne bloki bajtów
+        :param zapisz: funkcja przyjmująca kolejne spakowane bajty (np. plik.write)
+        :return: (liczba zakodowanych bajtów, liczba bitów paddingu)
+        """
+        liczba_znakow = 0
+        akumulator = 0
+        liczba_bitow = 0
+        bufor = bytearray()
+
+        for blok in bloki:
+            for bajt in blok:
+                wartosc, dlugosc = self.koduj_pojedynczy_znak_bitowo(chr(bajt))
+                akumulator = (akumulator << dlugosc) | wartosc
+                liczba_bitow += dlugosc
+                # akumulator trzymamy krótki, inaczej każde przesunięcie kosztuje O(rozmiar bloku)
+                while liczba_bitow >= 8:
+                    liczba_bitow -= 8
+                    bufor.append(akumulator >> liczba_bitow)
+                    akumulator &= (1 << liczba_bitow) - 1
+            liczba_znakow += len(blok)
+
+            zapisz(bytes(bufor))
+            bufor.clear()
+
+        padding_uzyty = (8 - liczba_bitow) % 8
+        if liczba_bitow:
+            zapisz((akumulator << padding_uzyty).to_bytes(1, byteorder="big"))
+
+        return liczba_znakow, padding_uzyty
+
     def dekoduj(self, zakodowane):
         wynik = []
-        pierwszy_znak = chr(int(zakodowane[:8], 2))
-        wynik.append(ord(pierwszy_znak))
-        self._zarejestruj_znak(pierwszy_znak)
+        i = 0
+        if self._korzen is self._NYT:
+            pierwszy_znak = chr(int(zakodowane[:8], 2))
+            wynik.append(ord(pierwszy_znak))
+            self._zarejestruj_znak(pierwszy_znak)
+            i = 8
 
         wezel = self._korzen
-        i = 8
         while i < len(zakodowane):
             obecny_bit = zakodowane[i]
 
@@ -176,6 +406,105 @@ class KodowanieHuffmana:
 
         return wynik
 
+    def _wypelnij_tablice_dekodowania(self, wezel, prefiks, glebokosc):
+        """
+        Tablica obejmuje górne BITY_TABLICY_DEKODOWANIA poziomów drzewa: dla każdego prefiksu
+        tej długości trzyma (węzeł, liczba zużytych bitów) - liść, jeśli kod jest krótszy,
+        inaczej węzeł wewnętrzny, od którego trzeba dalej iść bit po bicie.
+        Uzupełnia zakres tablicy odpowiadający poddrzewu `wezel` o kodzie `prefiks` długości `glebokosc`.
+        """
+        bity = BITY_TABLICY_DEKODOWANIA
+        tablica = self._tablica_dekodowania
+        stos = [(wezel, prefiks, glebokosc)]
+        while stos:
+            wezel, prefiks, glebokosc = stos.pop()
+            if wezel.znak or glebokosc == bity:
+                przesuniecie = bity - glebokosc
+                poczatek = prefiks << przesuniecie
+                tablica[poczatek:poczatek + (1 << przesuniecie)] = [(wezel, glebokosc)] * (1 << przesuniecie)
+            else:
+                stos.append((wezel.lewy, prefiks << 1, glebokosc + 1))
+                stos.append((wezel.prawy, (prefiks << 1) | 1, glebokosc + 1))
+
+    def _aktualizuj_tablice_dekodowania(self):
+        if self._tablica_dekodowania is None:
+            self._tablica_dekodowania = [None] * (1 << BITY_TABLICY_DEKODOWANIA)
+            self._wypelnij_tablice_dekodowania(self._korzen, 0, 0)
+            return
+
+        # Nieaktualny wpis zawsze leży w zakresie któregoś z przestawionych węzłów,
+        # wystarczy więc przepisać zakresy tych, które są w górnych poziomach drzewa
+        for wezel in self._zmienione_wezly:
+            prefiks = 0
+            glebokosc = 0
+            w = wezel
+            while w.rodzic is not None and glebokosc <= BITY_TABLICY_DEKODOWANIA:
+                prefiks |= (w.rodzic.prawy is w) << glebokosc
+                glebokosc += 1
+                w = w.rodzic
+            if glebokosc <= BITY_TABLICY_DEKODOWANIA:
+                self._wypelnij_tablice_dekodowania(wezel, prefiks, glebokosc)
+        self._zmienione_wezly.clear()
+
+    def dekoduj_strumien(self, bloki, liczba_bitow):
+        """
+        Dekoduje strumień spakowanych bajtów (kolejne bity od najstarszego).
+        Kilka bitów naraz rozwiązuje tablica górnych poziomów drzewa, aktualizowana tylko
+        w zakresach przestawionych węzłów; dłuższe kody są dokańczane bit po bicie.
+        :param bloki: iterowalne bloki bajtów
+        :param liczba_bitow: liczba znaczących bitów w całym strumieniu (bez paddingu)
+        :return: generator kolejnych zdekodowanych bloków (bytes)
+        """
+        bity_tablicy = BITY_TABLICY_DEKODOWANIA
+        maska = (1 << bity_tablicy) - 1
+        bajty = itertools.chain.from_iterable(bloki)
+        wynik = bytearray()
+        akumulator = 0
+        dostepne = 0
+        pozostalo = liczba_bitow
+
+        while pozostalo > 0:
+            # Za końcem strumienia dopełniamy zerami - i tak liczy się tylko `pozostalo`
+            while dostepne < bity_tablicy + 8:
+                akumulator = (akumulator << 8) | next(bajty, 0)
+                dostepne += 8
+
+            if self._tablica_dekodowania is None or self._zmienione_wezly:
+                self._aktualizuj_tablice_dekodowania()
+
+            wezel, zuzyte = self._tablica_dekodowania[(akumulator >> (dostepne - bity_tablicy)) & maska]
+            dostepne -= zuzyte
+
+            while not wezel.znak:
+                if not dostepne:
+                    akumulator = next(bajty, 0)
+                    dostepne = 8
+                dostepne -= 1
+                wezel = wezel.prawy if (akumulator >> dostepne) & 1 else wezel.lewy
+                zuzyte += 1
+            pozostalo -= zuzyte
+
+            if wezel is self._NYT:
+                while dostepne < 8:
+                    akumulator = (akumulator << 8) | next(bajty, 0)
+                    dostepne += 8
+                dostepne -= 8
+                znak = chr((akumulator >> dostepne) & 0xFF)
+                pozostalo -= 8
+            else:
+                znak = wezel.znak
+
+            wynik.append(ord(znak))
+            self._zarejestruj_znak(znak)
+            akumulator &= (1 << dostepne) - 1
+
+            if len(wynik) >= ROZMIAR_BLOKU:
+                yield bytes(wynik)
+                wynik.clear()
+
+        if wynik:
+            yield bytes(wynik)
+
     def srednia_dlugosc_kodu(self):
         dlugosci = []
         liczba_znakow = 0
@@ -183,7 +512,7 @@ class KodowanieHuffmana:
         for znak in self._wszystkie_znaki:
             if znak is None:
                 continue
-            dlugosci.append(len(self._generuj_kod_wezla(znak)))
+            dlugosci.append(self._kod_wezla(znak)[1])
             liczba_znakow += 1
 
         return sum(dlugosci) / liczba_znakow
@@ -201,61 +530,669 @@ class KodowanieHuffmana:
         return wynik + math.log2(self._korzen.waga)
 
 
+class KodowanieVittera(KodowanieHuffmana):
+    """
+    Aktualizacja drzewa wg algorytmu Vittera (Λ). Bloki tworzą węzły tej samej wagi i rodzaju,
+    a w obrębie jednej wagi liście poprzedzają węzły wewnętrzne - to utrzymuje minimalną
+    wysokość drzewa. Kodowanie, dekodowanie i statystyki są wspólne z KodowanieHuffmana.
+    """
+    SILNIK = 'vitter'
+
+    def __init__(self):
+        super().__init__()
+        # Osobni liderzy bloków liści i węzłów wewnętrznych, wg wagi. Korzeń (zawsze na szczycie
+        # numeracji) ani węzły o wadze 0 (NYT i świeżo dodana para) nie należą do bloków.
+        self._liderzy_lisci = {}
+        self._liderzy_wewnetrznych = {}
+
+    def _odbuduj_liderow(self):
+        self._liderzy_lisci = {}
+        self._liderzy_wewnetrznych = {}
+        for w in self._wezly_wg_numeru:
+            if w is not None and w.waga and w.rodzic is not None:
+                liderzy = self._liderzy_lisci if w.lewy is None else self._liderzy_wewnetrznych
+                liderzy[w.waga] = w
+
+    def _zarejestruj_znak(self, znak):
+        """
+        Dla kolejnych węzłów od liścia do korzenia SlideAndIncrement: węzeł przechodzi na czoło
+        swojego bloku, potem przesuwa się ponad następny blok - liść ponad węzły wewnętrzne tej samej
+        wagi, węzeł wewnętrzny ponad liście o wadze większej o 1 - a na koniec zwiększa wagę.
+        Bloki zajmują ciągłe zakresy numerów w kolejności: liście wagi w, węzły wewnętrzne wagi w,
+        liście wagi w + 1, ..., więc ich granice wyznaczają liderzy, a przesunięcie ponad blok
+        jest jednym obrotem zakresu.
+        """
+        wezly = self._wezly_wg_numeru
+        liderzy_lisci = self._liderzy_lisci
+        liderzy_wewnetrznych = self._liderzy_wewnetrznych
+        wezel = self._wszystkie_znaki[ord(znak)]
+        lisc_do_zwiekszenia = None
+
+        if wezel is None:
+            wezel = rodzic_nyt = self._rozdziel_nyt(znak)
+            lisc_do_zwiekszenia = wezel.prawy
+        else:
+            lider = liderzy_lisci[wezel.waga]
+            if lider is not wezel:
+                self._zamien_wezly(wezel, lider)
+                liderzy_lisci[wezel.waga] = wezel
+            rodzic_nyt = self._NYT.rodzic
+            if wezel.rodzic is rodzic_nyt:
+                # Rodzeństwo NYT ma tę samą wagę co rodzic - zwiększamy je dopiero po nim
+                lisc_do_zwiekszenia = wezel
+                wezel = rodzic_nyt
+
+        while True:
+            waga = wezel.waga
+            rodzic = wezel.rodzic
+            numer = wezel.numer
+
+            if rodzic is None:
+                wezel.waga = waga + 1
+                if lisc_do_zwiekszenia is None:
+                    break
+                wezel = lisc_do_zwiekszenia
+
+            elif wezel.lewy is None:
+                if waga:
+                    lider = liderzy_lisci[waga]
+                    if lider is not wezel:
+                        self._zamien_wezly(wezel, lider)
+                        rodzic = wezel.rodzic
+                        numer = wezel.numer
+                    # wezel opuszcza swój blok - przywództwo przejmuje węzeł tuż poniżej
+                    ponizej = wezly[numer - 1]
+                    if ponizej.waga == waga:
+                        liderzy_lisci[waga] = ponizej
+                    else:
+                        del liderzy_lisci[waga]
+
+                # Tuż nad czołem bloku liści wagi w może zaczynać się tylko blok węzłów wewnętrznych wagi w
+                nastepny = wezly[numer + 1]
+                if nastepny.waga == waga and nastepny is not rodzic:
+                    if rodzic.waga == waga:
+                        self._obroc_zakres(numer, rodzic.numer - 1)
+                    else:
+                        self._obroc_zakres(numer, liderzy_wewnetrznych[waga].numer)
+
+                waga += 1
+                wezel.waga = waga
+                if waga not in liderzy_lisci:
+                    liderzy_lisci[waga] = wezel
+                if wezel is lisc_do_zwiekszenia:
+                    break
+                wezel = wezel.rodzic
+
+            else:
+                if waga:
+                    lider = liderzy_wewnetrznych[waga]
+                    if lider is not wezel:
+                        # Rodzeństwo NYT może mieć rodzica w tym samym bloku - wtedy staje tuż pod nim
+                        if rodzic.waga == waga:
+                            lider = wezly[rodzic.numer - 1]
+                        if lider is not wezel:
+                            self._zamien_wezly(wezel, lider)
+                            if liderzy_wewnetrznych[waga] is lider:
+                                liderzy_wewnetrznych[waga] = wezel
+                            rodzic = wezel.rodzic
+                            numer = wezel.numer
+                        lider = liderzy_wewnetrznych[waga]
+                    if lider is wezel:
+                        ponizej = wezly[numer - 1]
+                        if ponizej.waga == waga and ponizej.lewy is not None:
+                            liderzy_wewnetrznych[waga] = ponizej
+                        else:
+                            del liderzy_wewnetrznych[waga]
+
+                # ...a nad czołem bloku węzłów wewnętrznych wagi w - tylko blok liści wagi w + 1
+                waga += 1
+                nastepny = wezly[numer + 1]
+                if nastepny.waga == waga and nastepny.lewy is None:
+                    self._obroc_zakres(numer, liderzy_lisci[waga].numer)
+
+                wezel.waga = waga
+                if waga not in liderzy_wewnetrznych:
+                    liderzy_wewnetrznych[waga] = wezel
+                elif wezel is rodzic_nyt and liderzy_wewnetrznych[waga].numer < wezel.numer:
+                    # drugie dziecko NYT mogło właśnie dojść do tej wagi tuż pod swoim rodzicem
+                    liderzy_wewnetrznych[waga] = wezel
+                wezel = rodzic
+
+    def _obroc_zakres(self, poczatek, koniec):
+        """
+        Przenosi węzeł o numerze `poczatek` na miejsce węzła `koniec`, a pozostałe węzły zakresu
+        o jedno miejsce w dół - tak jak ciąg zamian sąsiadów, ale z jednym przepięciem każdego
+        węzła. Liczy się jako jedna zamiana.
+        """
+        wezly = self._wezly_wg_numeru
+        if koniec == poczatek + 1:
+            self._zamien_wezly(wezly[poczatek], wezly[koniec])
+            return
+
+        zakres = wezly[poczatek:koniec + 1]
+        miejsca = [(w.rodzic, w.rodzic.lewy is w) for w in zakres]
+        for w in zakres:
+            self._uniewaznij_kody(w)
+        if self._tablica_dekodowania is not None:
+            # Zmieniają się tylko dzieci rodziców z `miejsca` - przepisujemy zakres każdego z nich raz
+            self._zmienione_wezly.extend(dict.fromkeys(rodzic for rodzic, _ in miejsca))
+        self._liczba_zamian += 1
+
+        zakres.append(zakres.pop(0))
+        for numer, w, (rodzic, lewy) in zip(range(poczatek, koniec + 1), zakres, miejsca):
+            w.numer = numer
+            wezly[numer] = w
+            w.rodzic = rodzic
+            if lewy:
+                rodzic.lewy = w
+            else:
+                rodzic.prawy = w
+
+
+SILNIKI = {'fgk': KodowanieHuffmana, 'vitter': KodowanieVittera}
+# indeks silnika zapisywany w nagłówku: w bitach 3-7 bajtu paddingu strumienia i w osobnym bajcie kontenera;
+# fgk = 0, więc strumienie zapisane przed wprowadzeniem tego pola dekodują się bez zmian
+KOLEJNOSC_SILNIKOW = ['fgk', 'vitter']
+
+
+def bajt_paddingu(padding_uzyty, silnik):
+    return padding_uzyty | (KOLEJNOSC_SILNIKOW.index(silnik) << 3)
+
+
+def silnik_z_naglowka(indeks, silnik=None):
+    """
+    :param indeks: indeks silnika odczytany z nagłówka
+    :param silnik: silnik podany przez użytkownika albo None, jeśli ma zostać wybrany z nagłówka
+    :return: nazwa silnika, którym zakodowano dane
+    """
+    if indeks >= len(KOLEJNOSC_SILNIKOW):
+        raise Exception(f"Nieznany silnik w nagłówku: {indeks}")
+    zapisany = KOLEJNOSC_SILNIKOW[indeks]
+    if silnik is not None and silnik != zapisany:
+        raise Exception(f"Plik zakodowano silnikiem {zapisany}, a nie {silnik}")
+    return zapisany
+
+
+def silnik_pliku(plik_wejsciowy, silnik=None):
+    """
+    Silnik, którym zakodowano plik w formacie koduj_plik.
+    """
+    with open(plik_wejsciowy, "rb") as fi:
+        naglowek = fi.read(1)
+    if not naglowek:
+        raise Exception("Pusty plik wejściowy")
+    return silnik_z_naglowka(naglowek[0] >> 3, silnik)
+
+
+def utworz_model(silnik='fgk', migawka=None):
+    """
+    Świeży model wybranego silnika albo model odtworzony z migawki (bytes).
+    """
+    if migawka is None:
+        return SILNIKI[silnik]()
+    return SILNIKI[silnik].z_migawki(migawka)
+
+
+def trenuj_migawke(plik_korpusu, silnik='fgk', rozmiar_bloku=ROZMIAR_BLOKU):
+    """
+    Przepuszcza korpus przez model (bez emitowania kodów) i zwraca migawkę jego stanu.
+    """
+    model = SILNIKI[silnik]()
+    with open(plik_korpusu, "rb") as fi:
+        for blok in czytaj_bloki(fi, rozmiar_bloku):
+            for bajt in blok:
+                model._zarejestruj_znak(chr(bajt))
+    return model.zapisz_migawke()
+
+
+class KodowanieStatyczne:
+    """
+    Dwuprzebiegowe kanoniczne kodowanie Huffmana. Kody wynikają wyłącznie z długości,
+    więc w nagłówku wystarczy 256 długości (po 4 bity), a dekodowanie to jedno
+    odczytanie tablicy na znak.
+    """
+
+    def __init__(self, dlugosci):
+        self._dlugosci = list(dlugosci)
+        self._kody = [0] * 256
+
+        kod = 0
+        poprzednia_dlugosc = 0
+        for dlugosc, znak in sorted((d, z) for z, d in enumerate(self._dlugosci) if d):
+            kod <<= dlugosc - poprzednia_dlugosc
+            self._kody[znak] = kod
+            kod += 1
+            poprzednia_dlugosc = dlugosc
+
+        self._bity_tablicy = max(self._dlugosci)
+        self._tablica_dekodowania = [None] * (1 << self._bity_tablicy)
+        for znak, dlugosc in enumerate(self._dlugosci):
+            if dlugosc:
+                przesuniecie = self._bity_tablicy - dlugosc
+                poczatek = self._kody[znak] << przesuniecie
+                self._tablica_dekodowania[poczatek:poczatek + (1 << przesuniecie)] = [(znak, dlugosc)] * (1 << przesuniecie)
+
+    @classmethod
+    def z_czestosci(cls, czestosci, maks_dlugosc=MAKS_DLUGOSC_KODU_STATYCZNEGO):
+        """
+        Buduje kod Huffmana o długościach ograniczonych do `maks_dlugosc`:
+        dopóki najdłuższy kod jest za długi, częstości są połowione (niezerowe zostają >= 1).
+        """
+        czestosci = [czestosci[z] for z in range(256)]
+        while True:
+            dlugosci = cls._dlugosci_huffmana(czestosci)
+            if max(dlugosci) <= maks_dlugosc:
+                return cls(dlugosci)
+            czestosci = [(c + 1) // 2 for c in czestosci]
+
+    @staticmethod
+    def _dlugosci_huffmana(czestosci):
+        dlugosci = [0] * 256
+        kopiec = [(c, z, [z]) for z, c in enumerate(czestosci) if c]
+        if len(kopiec) == 1:
+            dlugosci[kopiec[0][1]] = 1
+            return dlugosci
+
+        heapq.heapify(kopiec)
+        while len(kopiec) > 1:
+            c1, z1, znaki1 = heapq.heappop(kopiec)
+            c2, z2, znaki2 = heapq.heappop(kopiec)
+            for z in znaki1 + znaki2:
+                dlugosci[z] += 1
+            heapq.heappush(kopiec, (c1 + c2, min(z1, z2), znaki1 + znaki2))
+        return dlugosci
+
+    @classmethod
+    def z_naglowka(cls, naglowek):
+        dlugosci = []
+        for bajt in naglowek:
+            dlugosci.append(bajt >> 4)
+            dlugosci.append(bajt & 0xF)
+        return cls(dlugosci)
+
+    def naglowek(self):
+        return bytes((self._dlugosci[i] << 4) | self._dlugosci[i + 1] for i in range(0, 256, 2))
+
+    def koduj_strumien(self, bloki, zapisz):
+        """
+        Jak KodowanieHuffmana.koduj_strumien, ale kodem stałym.
+        :return: (liczba zakodowanych bajtów, liczba bitów paddingu)
+        """
+        kody = self._kody
+        dlugosci = self._dlugosci
+        liczba_znakow = 0
+        akumulator = 0
+        liczba_bitow = 0
+        bufor = bytearray()
+
+        for blok in bloki:
+            for bajt in blok:
+                akumulator = (akumulator << dlugosci[bajt]) | kody[bajt]
+                liczba_bitow += dlugosci[bajt]
+                if liczba_bitow >= 32:
+                    pelne_bajty, liczba_bitow = divmod(liczba_bitow, 8)
+                    bufor += (akumulator >> liczba_bitow).to_bytes(pelne_bajty, byteorder="big")
+                    akumulator &= (1 << liczba_bitow) - 1
+            liczba_znakow += len(blok)
+
+            pelne_bajty, liczba_bitow = divmod(liczba_bitow, 8)
+            bufor += (akumulator >> liczba_bitow).to_bytes(pelne_bajty, byteorder="big")
+            akumulator &= (1 << liczba_bitow) - 1
+            zapisz(bytes(bufor))
+            bufor.clear()
+
+        padding_uzyty = (8 - liczba_bitow) % 8
+        if liczba_bitow:
+            zapisz((akumulator << padding_uzyty).to_bytes(1, byteorder="big"))
+
+        return liczba_znakow, padding_uzyty
+
+    def dekoduj_strumien(self, bloki, liczba_znakow):
+        """
+        Dekoduje `liczba_znakow` znaków: każdy znak to jedno odczytanie tablicy kanonicznej
+        indeksowanej najdłuższym kodem.
+        :return: generator kolejnych zdekodowanych bloków (bytes)
+        """
+        bity_tablicy = self._bity_tablicy
+        maska = (1 << bity_tablicy) - 1
+        tablica = self._tablica_dekodowania
+        bajty = itertools.chain.from_iterable(bloki)
+        wynik = bytearray()
+        akumulator = 0
+        dostepne = 0
+
+        for _ in range(liczba_znakow):
+            while dostepne < bity_tablicy:
+                akumulator = ((akumulator << 8) | next(bajty, 0))
+                dostepne += 8
+
+            znak, dlugosc = tablica[(akumulator >> (dostepne - bity_tablicy)) & maska]
+            dostepne -= dlugosc
+            akumulator &= (1 << dostepne) - 1
+            wynik.append(znak)
+
+            if len(wynik) >= ROZMIAR_BLOKU:
+                yield bytes(wynik)
+                wynik.clear()
+
+        if wynik:
+            yield bytes(wynik)
+
+    def srednia_dlugosc_kodu(self):
+        dlugosci = [d for d in self._dlugosci if d]
+        return sum(dlugosci) / len(dlugosci)
+
+
+def czytaj_bloki(plik, rozmiar_bloku=ROZMIAR_BLOKU):
+    blok = plik.read(rozmiar_bloku)
+    while blok:
+        yield blok
+        blok = plik.read(rozmiar_bloku)
+
+
+def koduj_plik(huffman, plik_wejsciowy, plik_wyjsciowy, rozmiar_bloku=ROZMIAR_BLOKU):
+    """
+    Koduje plik strumieniowo, blok po bloku.
+    Pierwszy bajt wyjścia to liczba bitów paddingu na końcu pliku (bity 0-2) i indeks silnika (bity 3-7).
+    :return: (liczba bajtów wejścia, liczba bajtów wyjścia)
+    """
+    with open(plik_wyjsciowy, "wb+") as fo:
+        with open(plik_wejsciowy, "rb") as fi:
+            fo.write(bytes([0]))  # miejsce na padding, uzupełniane na końcu
+            liczba_znakow, padding_uzyty = huffman.koduj_strumien(czytaj_bloki(fi, rozmiar_bloku), fo.write)
+            liczba_bajtow = fo.tell()
+
+            fo.seek(0)
+            fo.write(bytes([bajt_paddingu(padding_uzyty, huffman.SILNIK)]))
+
+    return liczba_znakow, liczba_bajtow
+
+
+def dekoduj_plik(huffman, plik_wejsciowy, plik_wyjsciowy, rozmiar_bloku=ROZMIAR_BLOKU):
+    """
+    Dekoduje plik strumieniowo, blok po bloku. Silnik modelu musi zgadzać się z zapisanym w nagłówku.
+    :return: liczba bajtów wyjścia
+    """
+    liczba_bajtow = 0
+    rozmiar_wejscia = os.path.getsize(plik_wejsciowy)
+
+    with open(plik_wyjsciowy, "wb+") as fo:
+        with open(plik_wejsciowy, "rb") as fi:
+            naglowek = fi.read(1)
+            if not naglowek:
+                raise Exception("Pusty plik wejściowy")
+            silnik_z_naglowka(naglowek[0] >> 3, huffman.SILNIK)
+            liczba_bitow = (rozmiar_wejscia - 1) * 8 - (naglowek[0] & 7)
+
+            for blok in huffman.dekoduj_strumien(czytaj_bloki(fi, rozmiar_bloku), liczba_bitow):
+                fo.write(blok)
+                liczba_bajtow += len(blok)
+
+    return liczba_bajtow
+
+
+def koduj_bajty(dane, silnik='fgk', migawka=None):
+    """
+    Koduje dane świeżym modelem w tym samym formacie co koduj_plik (bajt paddingu z silnikiem + bity).
+    """
+    wyjscie = bytearray([0])
+    _, padding_uzyty = utworz_model(silnik, migawka).koduj_strumien([dane], wyjscie.extend)
+    wyjscie[0] = bajt_paddingu(padding_uzyty, silnik)
+    return bytes(wyjscie)
+
+
+def dekoduj_bajty(dane, silnik=None, migawka=None):
+    """
+    Odwrotność koduj_bajty.
+    :param silnik: oczekiwany silnik; None - silnik zapisany w bajcie paddingu
+    """
+    if not dane:
+        raise Exception("Pusty blok wejściowy")
+    silnik = silnik_z_naglowka(dane[0] >> 3, silnik)
+    liczba_bitow = (len(dane) - 1) * 8 - (dane[0] & 7)
+    return b"".join(utworz_model(silnik, migawka).dekoduj_strumien([memoryview(dane)[1:]], liczba_bitow))
+
+
+def _mapuj_w_oknie(pula, funkcja, elementy, okno):
+    """
+    Jak pula.map, ale zleca naraz co najwyżej `okno` zadań, żeby nie wczytywać całego pliku do pamięci.
+    Wyniki zwracane są w kolejności wejścia.
+    """
+    oczekujace = collections.deque()
+    for element in elementy:
+        oczekujace.append(pula.submit(funkcja, element))
+        if len(oczekujace) >= okno:
+            yield oczekujace.popleft().result()
+    while oczekujace:
+        yield oczekujace.popleft().result()
+
+
+def czy_kontener(plik_wejsciowy):
+    with open(plik_wejsciowy, "rb") as fi:
+        return fi.read(len(MAGIC_KONTENERA)) == MAGIC_KONTENERA
+
+
+def koduj_kontener(plik_wejsciowy, plik_wyjsciowy, rozmiar_bloku=ROZMIAR_BLOKU_KONTENERA, liczba_procesow=None, silnik='fgk', migawka=None):
+    """
+    Dzieli plik na bloki stałej długości i koduje każdy świeżym modelem w puli procesów.
+    Format: MAGIC_KONTENERA, indeks silnika (1 B), rozmiar bloku (4 B), rozmiar danych (8 B), liczba bloków (4 B),
+    offsety kolejnych bloków w pliku (8 B każdy), a potem bloki w formacie koduj_bajty.
+    :return: (liczba bajtów wejścia, liczba bajtów wyjścia)
+    """
+    liczba_procesow = liczba_procesow or os.cpu_count() or 1
+    rozmiar_wejscia = os.path.getsize(plik_wejsciowy)
+    liczba_blokow = math.ceil(rozmiar_wejscia / rozmiar_bloku)
+
+    with open(plik_wyjsciowy, "wb+") as fo:
+        with open(plik_wejsciowy, "rb") as fi, ProcessPoolExecutor(liczba_procesow) as pula:
+            fo.write(MAGIC_KONTENERA)
+            fo.write(bytes([KOLEJNOSC_SILNIKOW.index(silnik)]))
+            fo.write(rozmiar_bloku.to_bytes(4, byteorder="big"))
+            fo.write(rozmiar_wejscia.to_bytes(8, byteorder="big"))
+            fo.write(liczba_blokow.to_bytes(4, byteorder="big"))
+            pozycja_offsetow = fo.tell()
+            fo.write(bytes(8 * liczba_blokow))  # offsety uzupełniane na końcu
+
+            offsety = []
+            okno = 2 * liczba_procesow
+            koduj = functools.partial(koduj_bajty, silnik=silnik, migawka=migawka)
+            for zakodowany in _mapuj_w_oknie(pula, koduj, czytaj_bloki(fi, rozmiar_bloku), okno):
+                offsety.append(fo.tell())
+                fo.write(zakodowany)
+            liczba_bajtow = fo.tell()
+
+            fo.seek(pozycja_offsetow)
+            fo.write(b"".join(o.to_bytes(8, byteorder="big") for o in offsety))
+
+    return rozmiar_wejscia, liczba_bajtow
+
+
+def czytaj_naglowek_kontenera(fi, silnik=None):
+    """
+    :param silnik: oczekiwany silnik; None - silnik zapisany w nagłówku
+    :return: (silnik, rozmiar bloku, rozmiar danych, lista offsetów bloków z offsetem końca pliku na końcu)
+    """
+    if fi.read(len(MAGIC_KONTENERA)) != MAGIC_KONTENERA:
+        raise Exception("To nie jest kontener AHC")
+    silnik = silnik_z_naglowka(fi.read(1)[0], silnik)
+    rozmiar_bloku = int.from_bytes(fi.read(4), byteorder="big")
+    rozmiar_danych = int.from_bytes(fi.read(8), byteorder="big")
+    liczba_blokow = int.from_bytes(fi.read(4), byteorder="big")
+    surowe = fi.read(8 * liczba_blokow)
+    offsety = [int.from_bytes(surowe[i:i + 8], byteorder="big") for i in range(0, len(surowe), 8)]
+
+    fi.seek(0, os.SEEK_END)
+    offsety.append(fi.tell())
+    return silnik, rozmiar_bloku, rozmiar_danych, offsety
+
+
+def dekoduj_kontener(plik_wejsciowy, plik_wyjsciowy, liczba_procesow=None, silnik=None, migawka=None):
+    """
+    Dekoduje kontener z koduj_kontener, po jednym bloku na proces, zapisując bloki po kolei.
+    :return: liczba bajtów wyjścia
+    """
+    liczba_procesow = liczba_procesow or os.cpu_count() or 1
+    liczba_bajtow = 0
+
+    with open(plik_wyjsciowy, "wb+") as fo:
+        with open(plik_wejsciowy, "rb") as fi, ProcessPoolExecutor(liczba_procesow) as pula:
+            silnik, _, _, offsety = czytaj_naglowek_kontenera(fi, silnik)
+
+            def bloki():
+                for poczatek, koniec in zip(offsety, offsety[1:]):
+                    fi.seek(poczatek)
+                    yield fi.read(koniec - poczatek)
+
+            okno = 2 * liczba_procesow
+            dekoduj = functools.partial(dekoduj_bajty, silnik=silnik, migawka=migawka)
+            for blok in _mapuj_w_oknie(pula, dekoduj, bloki(), okno):
+                fo.write(blok)
+                liczba_bajtow += len(blok)
+
+    return liczba_bajtow
+
+
+def dekoduj_zakres(plik_wejsciowy, poczatek, dlugosc, silnik=None, migawka=None):
+    """
+    Dekoduje z kontenera tylko bajty [poczatek, poczatek + dlugosc) oryginalnych danych.
+    Każdy blok kontenera zaczyna się od świeżego modelu, więc nagłówek z offsetami bloków
+    służy za indeks - dekodowane są wyłącznie bloki pokrywające zakres.
+    :return: zdekodowane bajty (krótsze, jeśli zakres wychodzi poza koniec danych)
+    """
+    if poczatek < 0 or dlugosc < 0:
+        raise Exception("Nieprawidłowy zakres")
+
+    with open(plik_wejsciowy, "rb") as fi:
+        silnik, rozmiar_bloku, rozmiar_danych, offsety = czytaj_naglowek_kontenera(fi, silnik)
+        koniec = min(poczatek + dlugosc, rozmiar_danych)
+        if poczatek >= koniec:
+            return b""
+
+        pierwszy_blok = poczatek // rozmiar_bloku
+        ostatni_blok = (koniec - 1) // rozmiar_bloku
+
+        wynik = bytearray()
+        for i in range(pierwszy_blok, ostatni_blok + 1):
+            fi.seek(offsety[i])
+            wynik += dekoduj_bajty(fi.read(offsety[i + 1] - offsety[i]), silnik, migawka)
+
+    przesuniecie = poczatek - pierwszy_blok * rozmiar_bloku
+    return bytes(wynik[przesuniecie:przesuniecie + koniec - poczatek])
+
+
+def czy_statyczny(plik_wejsciowy):
+    with open(plik_wejsciowy, "rb") as fi:
+        return fi.read(len(MAGIC_STATYCZNY)) == MAGIC_STATYCZNY
+
+
+def koduj_plik_statycznie(plik_wejsciowy, plik_wyjsciowy, rozmiar_bloku=ROZMIAR_BLOKU):
+    """
+    Pierwszy przebieg liczy częstości bajtów, drugi koduje kanonicznym kodem Huffmana.
+    Format: MAGIC_STATYCZNY, liczba bajtów danych (8 B), 256 długości kodów po 4 bity, bity danych.
+    :return: (liczba bajtów wejścia, liczba bajtów wyjścia, model, częstości)
+    """
+    czestosci = collections.Counter()
+    with open(plik_wejsciowy, "rb") as fi:
+        for blok in czytaj_bloki(fi, rozmiar_bloku):
+            czestosci.update(blok)
+
+    model = KodowanieStatyczne.z_czestosci(czestosci)
+    liczba_znakow = sum(czestosci.values())
+
+    with open(plik_wyjsciowy, "wb+") as fo:
+        with open(plik_wejsciowy, "rb") as fi:
+            fo.write(MAGIC_STATYCZNY)
+            fo.write(liczba_znakow.to_bytes(8, byteorder="big"))
+            fo.write(model.naglowek())
+            model.koduj_strumien(czytaj_bloki(fi, rozmiar_bloku), fo.write)
+            liczba_bajtow = fo.tell()
+
+    return liczba_znakow, liczba_bajtow, model, czestosci
+
+
+def dekoduj_plik_statycznie(plik_wejsciowy, plik_wyjsciowy, rozmiar_bloku=ROZMIAR_BLOKU):
+    """
+    :return: liczba bajtów wyjścia
+    """
+    liczba_bajtow = 0
+
+    with open(plik_wyjsciowy, "wb+") as fo:
+        with open(plik_wejsciowy, "rb") as fi:
+            if fi.read(len(MAGIC_STATYCZNY)) != MAGIC_STATYCZNY:
+                raise Exception("To nie jest plik kodowania statycznego")
+            liczba_znakow = int.from_bytes(fi.read(8), byteorder="big")
+            model = KodowanieStatyczne.z_naglowka(fi.read(128))
+
+            for blok in model.dekoduj_strumien(czytaj_bloki(fi, rozmiar_bloku), liczba_znakow):
+                fo.write(blok)
+                liczba_bajtow += len(blok)
+
+    return liczba_bajtow
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Kodowanie Huffmana')
-    parser.add_argument('tryb', choices=['koduj', 'dekoduj'], help='Tryb: koduj lub dekoduj')
+    parser.add_argument('tryb', choices=['koduj', 'dekoduj', 'trenuj'], help='Tryb: koduj, dekoduj lub trenuj (zapis migawki modelu wytrenowanego na pliku wejściowym)')
     parser.add_argument('plik_wejsciowy', help='Ścieżka do pliku wejściowego')
     parser.add_argument('plik_wyjsciowy', help='Ścieżka do pliku wyjściowego')
+    parser.add_argument('--rozmiar-bloku', type=int, default=ROZMIAR_BLOKU, help='Rozmiar bloku odczytu w bajtach')
+    parser.add_argument('--kontener', action='store_true', help='Kodowanie niezależnych bloków w puli procesów')
+    parser.add_argument('--blok-kontenera', type=int, default=ROZMIAR_BLOKU_KONTENERA, help='Rozmiar bloku kontenera w bajtach')
+    parser.add_argument('--procesy', type=int, default=None, help='Liczba procesów (domyślnie liczba rdzeni)')
+    parser.add_argument('--zakres', type=int, nargs=2, metavar=('POCZATEK', 'DLUGOSC'), help='Dekoduj tylko podany zakres bajtów (wymaga kontenera)')
+    parser.add_argument('--statyczny', action='store_true', help='Dwuprzebiegowe kanoniczne kodowanie Huffmana')
+    parser.add_argument('--silnik', '--engine', choices=sorted(SILNIKI), default=None, help='Algorytm aktualizacji drzewa (domyślnie fgk; przy dekodowaniu odczytywany z pliku i tylko sprawdzany)')
+    parser.add_argument('--model', help='Migawka modelu (z trybu trenuj), od której startują koder i dekoder')
     args = parser.parse_args()
 
-    huffman = KodowanieHuffmana()
+    migawka = None
+    if args.model is not None:
+        if args.statyczny:
+            raise Exception("Migawka modelu nie dotyczy trybu statycznego")
+        with open(args.model, "rb") as fm:
+            migawka = fm.read()
 
-    if args.tryb == "dekoduj":
+    silnik = args.silnik or 'fgk'
+
+    if args.tryb == "trenuj":
         with open(args.plik_wyjsciowy, "wb+") as fo:
-            with open(args.plik_wejsciowy, "rb") as fi:
-                bity_wejsciowe = ""
-                tmp = fi.read(1)
-                padding_uzyty = ord(tmp)
+            fo.write(trenuj_migawke(args.plik_wejsciowy, silnik, args.rozmiar_bloku))
+
+    elif args.tryb == "dekoduj":
+        if args.zakres is not None:
+            if not czy_kontener(args.plik_wejsciowy):
+                raise Exception("Dekodowanie zakresu wymaga pliku zakodowanego z opcją --kontener")
+            with open(args.plik_wyjsciowy, "wb+") as fo:
+                fo.write(dekoduj_zakres(args.plik_wejsciowy, *args.zakres, args.silnik, migawka))
+        elif czy_statyczny(args.plik_wejsciowy):
+            dekoduj_plik_statycznie(args.plik_wejsciowy, args.plik_wyjsciowy, args.rozmiar_bloku)
+        elif czy_kontener(args.plik_wejsciowy):
+            dekoduj_kontener(args.plik_wejsciowy, args.plik_wyjsciowy, args.procesy, args.silnik, migawka)
+        else:
+            huffman = utworz_model(silnik_pliku(args.plik_wejsciowy, args.silnik), migawka)
+            dekoduj_plik(huffman, args.plik_wejsciowy, args.plik_wyjsciowy, args.rozmiar_bloku)
 
-                tmp = fi.read(1)
-                while tmp:
-                    tmp = ord(tmp)
-                    for i in range(0, 8):
-                        bity_wejsciowe += '1' if (tmp >> (7-i)) & 0b1 else '0'
-                    tmp = fi.read(1)
+    elif args.statyczny:
+        liczba_znakow, liczba_bajtow, model, czestosci = koduj_plik_statycznie(args.plik_wejsciowy, args.plik_wyjsciowy, args.rozmiar_bloku)
 
-                bity_wejsciowe = bity_wejsciowe[:-padding_uzyty]
+        if liczba_znakow:
+            print("Tryb: statyczny (kanoniczny)")
+            print("Średnia długość kodu:", model.srednia_dlugosc_kodu())
+            print("Współczynnik kompresji:", liczba_znakow/liczba_bajtow)
+            print("Entropia:", math.log2(liczba_znakow) - sum(c * math.log2(c) for c in czestosci.values()) / liczba_znakow)
 
-                bajty = huffman.dekoduj(bity_wejsciowe)
-                for b in bajty:
-                    fo.write(b.to_bytes(1, byteorder="big"))
+    elif args.kontener:
+        liczba_znakow, liczba_bajtow = koduj_kontener(args.plik_wejsciowy, args.plik_wyjsciowy, args.blok_kontenera, args.procesy, silnik, migawka)
+        print("Współczynnik kompresji:", liczba_znakow/liczba_bajtow)
 
     else:  # args.tryb == "koduj"
-        with open(args.plik_wyjsciowy, "wb+") as fo:
-            with open(args.plik_wejsciowy, "rb") as fi:
-                wyjscie = ""
-                bajt = fi.read(1)
-                liczba_znakow = 1
-                while bajt:
-                    wyjscie += huffman.koduj_pojedynczy_znak(bajt)
-                    bajt = fi.read(1)
-                    liczba_znakow += 1
-
-                wyjscie_bajty = []
-                padding_uzyty = 0
-                for i in range(0, math.ceil(len(wyjscie)/8)):
-                    tmp = wyjscie[(i*8):((i+1)*8)]
-                    if len(tmp) != 8:
-                        padding_uzyty = 8-len(tmp)
-                        tmp += "0" * padding_uzyty
-                    tmp = int(tmp, 2)
-                    wyjscie_bajty.append(tmp)
-
-                wyjscie_bajty = [padding_uzyty] + wyjscie_bajty
-
-                for b in wyjscie_bajty:
-                    fo.write(b.to_bytes(1, byteorder='big'))
-
-                print("Średnia długość kodu:", huffman.srednia_dlugosc_kodu())
-                print("Współczynnik kompresji:", liczba_znakow/len(wyjscie_bajty))
-                print("Entropia:", huffman.entropia())
+        huffman = utworz_model(silnik, migawka)
+        liczba_znakow, liczba_bajtow = koduj_plik(huffman, args.plik_wejsciowy, args.plik_wyjsciowy, args.rozmiar_bloku)
+
+        if liczba_znakow:
+            print("Silnik:", silnik)
+            print("Średnia długość kodu:", huffman.srednia_dlugosc_kodu())
+            print("Współczynnik kompresji:", liczba_znakow/liczba_bajtow)
+            print("Entropia:", huffman.entropia())
+            print("Pamięć kodów (trafienia/chybienia):", huffman.trafienia_kodow, "/", huffman.chybienia_kodow)
+            print("Liczba zamian węzłów:", huffman.liczba_zamian)
@@ -0,0 +1,57 @@
+import os
+import collections
+
+MAGIC = b"LZWC"
+CHUNK_SIZE = 1 << 20
+
+# container: MAGIC, chunk size (4 B), data size (8 B), number of chunks (4 B),
+# file offset of every chunk (8 B each), then the chunks, each a complete single-stream archive
+
+def is_container(data):
+    return data[:len(MAGIC)] == MAGIC
+
+def write_header(output, chunk_size, data_size):
+    """
+    :return: position of the offset table, to be filled in by write_offsets
+    """
+    num_chunks = -(-data_size // chunk_size)
+    output.write(MAGIC)
+    output.write(chunk_size.to_bytes(4, "big"))
+    output.write(data_size.to_bytes(8, "big"))
+    output.write(num_chunks.to_bytes(4, "big"))
+    table = output.tell()
+    output.write(bytes(8 * num_chunks))
+    return table
+
+def write_offsets(output, table, offsets):
+    output.seek(table)
+    output.write(b"".join(offset.to_bytes(8, "big") for offset in offsets))
+
+def read_header(inp):
+    """
+    :return: (chunk size, data size, offsets of the chunks followed by the end of file)
+    """
+    if inp.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not an LZW container")
+    chunk_size = int.from_bytes(inp.read(4), "big")
+    data_size = int.from_bytes(inp.read(8), "big")
+    num_chunks = int.from_bytes(inp.read(4), "big")
+    raw = inp.read(8 * num_chunks)
+    offsets = [int.from_bytes(raw[i:i + 8], "big") for i in range(0, len(raw), 8)]
+
+    inp.seek(0, os.SEEK_END)
+    offsets.append(inp.tell())
+    return chunk_size, data_size, offsets
+
+def map_window(pool, func, items, window):
+    """
+    Like pool.map, but keeps at most `window` tasks in flight so the whole file is never in memory.
+    Results come back in input order.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -1,112 +1,251 @@
-import sys
+import io
+import os
 import math
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from lzw_dictionary import LZWDictionary, POLICIES, FREEZE, RESET, CODE_MASK, POLICY_SHIFT, code_width
+from fibonacci import Fibonacci
+import container
+from preset import Preset, FLAG
 
-def fib_sequence(n):
-    sequence = []
-    a, b = 0, 1
-
-    sequence = [a]
-    for _ in range(n + 1):
-        sequence.append(b)
-        a, b = b, a + b
-
-    return sequence[1:]
-
-def fib_decode(code):
-    codes = [x + "1" for x in code.split("11")][:-1]
-    seq = fib_sequence(max(len(x) for x in codes))
-    return [
-        sum(seq[i] if x == "1" else 0 for i, x in enumerate(code))
-        for code in codes
-    ]
-
-def gamma(code):
-    codes = []
-    counter = 0
-    idx = 0
-    while idx < len(code):
-        if code[idx] == "0":
-            counter += 1
-            idx += 1
-        else:
-            codes.append(int(code[idx : idx + counter + 1], base=2))
-            idx += counter + 1
-            counter = 0
-    return codes
-
-def delta(code):
-    codes = []
-    L = 0
-    idx = 0
-    while idx < len(code):
-        if code[idx] == "0":
-            L += 1
-            idx += 1
-        else:
-            n = int(code[idx : idx + L + 1], base=2) - 1
-            idx += L + 1
-            codes.append(int("1" + code[idx : idx + n], base=2))
-            idx += n
-            L = 0
-    return codes
-
-def omega(code):
-    codes = []
-    i = 0
-    n = 1
-    while i < len(code):
-        if code[i] == "0":
-            codes.append(n)
-            n = 1
-            i += 1
-        elif code[i] == "1":
-            s = code[i : i + n + 1]
-            i += n + 1
-            n = int(s, base=2)
-    return codes
-
-def decode(input_file, output_file, func=omega):
+BUFFER_SIZE = 1 << 16
+
+class BitReader:
+    """
+    Reads bits MSB first from packed bytes, between bit offsets start and end.
+    """
+
+    def __init__(self, data, start=0, end=None):
+        self.data = data
+        self.index = start // 8
+        self.acc = 0
+        self.nbits = 0
+        self.remaining = (len(data) * 8 if end is None else end) - start
+
+        skip = start % 8
+        if skip and self.remaining > 0:
+            self.acc = data[self.index] & ((1 << (8 - skip)) - 1)
+            self.nbits = 8 - skip
+            self.index += 1
+
+    def _refill(self):
+        chunk = self.data[self.index : self.index + 8]
+        self.acc = (self.acc << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+        self.nbits += 8 * len(chunk)
+        self.index += len(chunk)
+
+    def read(self, n):
+        if n > self.remaining:
+            raise EOFError("truncated code stream")
+        while self.nbits < n:
+            self._refill()
+        self.nbits -= n
+        self.remaining -= n
+        value = self.acc >> self.nbits
+        self.acc &= (1 << self.nbits) - 1
+        return value
+
+    def zeros(self):
+        """
+        Skips a run of 0 bits and the 1 ending it.
+        :return: length of the run or None if the stream ends first
+        """
+        count = 0
+        while not self.acc:
+            count += self.nbits
+            self.nbits = 0
+            if count >= self.remaining or self.index >= len(self.data):
+                self.remaining = 0
+                return None
+            self._refill()
+
+        length = self.acc.bit_length()
+        count += self.nbits - length
+        if count >= self.remaining:
+            self.remaining = 0
+            return None
+
+        self.nbits = length - 1
+        self.acc &= (1 << self.nbits) - 1
+        self.remaining -= count + 1
+        return count
+
+FIBONACCI = Fibonacci()
+
+def fib_decode(bits):
+    return FIBONACCI.decode(bits)
+
+def gamma(bits):
+    while True:
+        n = bits.zeros()
+        if n is None:
+            return
+        yield (1 << n) | bits.read(n)
+
+def delta(bits):
+    while True:
+        L = bits.zeros()
+        if L is None:
+            return
+        n = ((1 << L) | bits.read(L)) - 1
+        yield (1 << n) | bits.read(n)
+
+def omega(bits):
+    while bits.remaining:
+        n = 1
+        while bits.read(1):
+            n = (1 << n) | bits.read(n)
+        yield n
+
+def binary(bits, max_dict=None, start=256):
+    count = 0
+    while True:
+        width = code_width(count, max_dict, start)
+        if bits.remaining < width:
+            return
+        code = bits.read(width)
+        count = 0 if code == max_dict else count + 1
+        yield code + 1
+
+# position in this list is the method tag in the first byte of the archive, as in encode.py
+CODES = [gamma, delta, omega, fib_decode, binary]
+
+def decode_bytes(data, output, func=None, max_dict=None, policy=None, preset=None):
+    """
+    Decodes a single-stream archive into the writable output.
+    The universal code and the dictionary limit are read from the archive header,
+    func, max_dict and policy only check them when given.
+    """
+    if not data or data[0] & CODE_MASK >= len(CODES):
+        raise ValueError("not an LZW archive: unknown universal code tag")
+    tag = data[0] & CODE_MASK
+    if func is not None and CODES[tag] is not func:
+        raise ValueError(f"archive was encoded with {CODES[tag].__name__}, not {func.__name__}")
+    func = CODES[tag]
+
+    header_len = 1
+    if data[0] & FLAG:
+        preset_id = int.from_bytes(data[1:5], "big")
+        if preset is None or preset.id != preset_id:
+            raise ValueError(f"archive needs the preset dictionary {preset_id:08x}")
+        header_len = 5
+    elif preset is not None:
+        raise ValueError("archive was encoded without a preset dictionary")
+
+    limit = (data[0] >> POLICY_SHIFT) & 3
+    if limit > len(POLICIES):
+        raise ValueError("not an LZW archive: unknown dictionary policy")
+    archive_max_dict = int.from_bytes(data[header_len:header_len + 4], "big") if limit else None
+    archive_policy = POLICIES[limit - 1] if limit else None
+    if max_dict is not None and max_dict != archive_max_dict:
+        raise ValueError(f"archive was encoded with max dictionary size {archive_max_dict or 'unlimited'}, not {max_dict}")
+    if policy is not None and archive_policy is not None and policy != archive_policy:
+        raise ValueError(f"archive was encoded with the {archive_policy} policy, not {policy}")
+    max_dict = archive_max_dict
+    policy = archive_policy or FREEZE
+    if limit:
+        header_len += 4
+
+    dictionary = LZWDictionary(max_dict, policy, preset.dictionary if preset else None)
+    prefix = dictionary.prefix
+    last_byte = dictionary.last_byte
+    length = dictionary.length
+
+    # padding?
+    if func.__name__ not in ["gamma", "delta", "binary"]:
+        bits = BitReader(data, 8 * header_len + 3, len(data) * 8 - (data[header_len] >> 5))
+    else:
+        bits = BitReader(data, 8 * header_len)
+
+    # phrases are written back to front into buf, which is flushed to the file when full
+    buf = bytearray(BUFFER_SIZE)
+    pos = 0
+    OLD = None
+    first = 0
+
+    codes = binary(bits, max_dict, len(dictionary)) if func is binary else func(bits)
+    for NEW in codes:
+        NEW -= 1
+        if policy == RESET and NEW == dictionary.clear_code:
+            dictionary.reset()
+            OLD = None
+            continue
+
+        # the encoder added this entry before emitting NEW, so NEW may already refer to it
+        pending = OLD is not None
+        if pending and NEW == dictionary.next_slot(OLD):
+            dictionary.add(OLD, first)
+            pending = False
+
+        n = length[NEW]
+        if pos + n > len(buf):
+            output.write(memoryview(buf)[:pos])
+            pos = 0
+            if n > len(buf):
+                buf = bytearray(n)
+
+        code = NEW
+        i = pos + n - 1
+        while code >= 256:
+            buf[i] = last_byte[code]
+            code = prefix[code]
+            i -= 1
+        buf[i] = code
+        first = code
+        pos += n
+
+        if pending:
+            dictionary.add(OLD, first)
+        dictionary.touch(NEW)
+        OLD = NEW
+
+    output.write(memoryview(buf)[:pos])
+
+def decode_chunk(data, func=None, max_dict=None, policy=None, preset=None):
+    output = io.BytesIO()
+    decode_bytes(data, output, func, max_dict, policy, preset)
+    return output.getvalue()
+
+def decode(input_file, output_file, func=None, max_dict=None, policy=None, workers=None, preset=None):
+    """
+    Decodes a single-stream archive or a container from encode_chunks, whose chunks are decoded
+    on a process pool and written in order.
+    """
     with open(input_file, "rb") as inp, open(output_file, "wb") as output:
-        dictionary = [bytes([i]) for i in range(256)]
-        hexstring = inp.read().hex()
-        bitstring = "".join(["{0:08b}".format(int(hexstring[x : x + 2], base=16)) for x in range(0, len(hexstring), 2)])
-
-        # padding?
-        if func.__name__ not in ["gamma", "delta"]:
-            num = bitstring[:3]
-            bitstring = bitstring[3:len(bitstring)-(int(num, base=2))]
-
-        codes = list(map(lambda x: x - 1, func(bitstring)))
-
-        idx = 0
-        OLD = codes[idx]
-        S = dictionary[OLD]
-        C = dictionary[OLD][:1]
-        result = S
-        idx += 1
-
-        while idx < len(codes):
-            NEW = codes[idx]
-            if NEW >= len(dictionary):
-                S = dictionary[OLD]
-                S = S + C
-            else:
-                S = dictionary[NEW]
-            result += S
-            C = S[:1]
-            dictionary.append(dictionary[OLD] + C)
-            OLD = NEW
-            idx += 1
-
-        output.write(result)
+        if not container.is_container(inp.read(len(container.MAGIC))):
+            inp.seek(0)
+            decode_bytes(inp.read(), output, func, max_dict, policy, preset)
+            return
+
+        inp.seek(0)
+        _, _, offsets = container.read_header(inp)
+
+        def chunks():
+            for start, end in zip(offsets, offsets[1:]):
+                inp.seek(start)
+                yield inp.read(end - start)
+
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as pool:
+            task = functools.partial(decode_chunk, func=func, max_dict=max_dict, policy=policy, preset=preset)
+            for chunk in container.map_window(pool, task, chunks(), 2 * workers):
+                output.write(chunk)
 
 if __name__ == "__main__":
-    if len(sys.argv) == 3:
-        decode(sys.argv[1], sys.argv[2])
-    elif len(sys.argv) == 4:
-        encoding_functions = {"--delta": delta, "--gamma": gamma, "--omega": omega, "--fib": fib_decode}
-        encoding_function = encoding_functions.get(sys.argv[3], omega)
+    parser = argparse.ArgumentParser(description="LZW decompression with universal coding of the input codes")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    coding = parser.add_mutually_exclusive_group()  # optional, the code is read from the archive
+    coding.add_argument("--delta", dest="func", action="store_const", const=delta)
+    coding.add_argument("--gamma", dest="func", action="store_const", const=gamma)
+    coding.add_argument("--omega", dest="func", action="store_const", const=omega)
+    coding.add_argument("--fib", dest="func", action="store_const", const=fib_decode)
+    coding.add_argument("--binary", dest="func", action="store_const", const=binary)
+    parser.add_argument("--max-dict", type=int, default=None, help="optional, checked against the size stored in the archive")
+    parser.add_argument("--policy", choices=POLICIES, default=None, help="optional, checked against the policy stored in the archive")
+    parser.add_argument("--preset", type=Preset.load, default=None, help="preset dictionary the archive was encoded with")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes for a chunked archive (all cores by default)")
+    args = parser.parse_args()
 
-        decode(sys.argv[1], sys.argv[2], encoding_function)
-    else:
-        print("\ncorrect parameters: <input_file> <output_file> <type_of_coding>\ntype of coding options: --delta --gamma --omega --fib\n")
+    decode(args.input_file, args.output_file, args.func, args.max_dict, args.policy, args.workers, args.preset)
@@ -1,27 +1,18 @@
-import sys
+import os
 import math
+import argparse
+import functools
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from lzw_dictionary import LZWDictionary, POLICIES, FREEZE, RESET, CODE_MASK, POLICY_SHIFT, code_width
+from fibonacci import Fibonacci
+import container
+from preset import Preset, FLAG
 
-def fib_sequence(n):
-    sequence = []
-    a, b = 0, 1
-
-    while a <= n:
-        sequence.append(a)
-        a, b = b, a + b
-
-    return sequence[1:]
+FIBONACCI = Fibonacci()
 
 def fib_encode(n):
-    sequence = fib_sequence(n)
-    result = ["0" for _ in sequence]
-
-    while n > 0:
-        i, x = [(i, x) for i, x in enumerate(sequence) if x <= n][-1]
-        result[i] = "1"
-        n %= x
-
-    result.append("1")
-    return "".join(result)
+    return FIBONACCI.encode(n)
 
 def omega(number):
     code = "0"
@@ -42,59 +33,186 @@ def delta(number):
     code = bin(number)[3:]
     return gamma(len(code) + 1) + code
 
-def encode(input_file, output_file, func=omega):
-    with open(input_file, "rb") as inp, open(output_file, "wb") as output:
-        dictionary = {chr(i): i for i in range(256)}
-        input_bytes = inp.read()
-        bitstring_output = ""
-
-        P = chr(int.from_bytes([input_bytes[0]], "big"))
-
-        for byte in input_bytes[1:]:
-            C = chr(int.from_bytes([byte], "big"))
-
-            if P + C in dictionary:
-                P = P + C
+def binary(codes, max_dict=None, start=256):
+    """
+    Packs the LZW codes MSB first, each one in code_width() bits.
+    """
+    out = bytearray()
+    acc = 0
+    nbits = 0
+    count = 0
+
+    for code in codes:
+        width = code_width(count, max_dict, start)
+        acc = (acc << width) | code
+        nbits += width
+        count = 0 if code == max_dict else count + 1
+
+        if nbits >= 64:
+            n = nbits // 8
+            nbits -= 8 * n
+            out += (acc >> nbits).to_bytes(n, "big")
+            acc &= (1 << nbits) - 1
+
+    if nbits:
+        n = (nbits + 7) // 8
+        out += (acc << (8 * n - nbits)).to_bytes(n, "big")
+    return bytes(out)
+
+def binary_length(codes, max_dict=None, start=256):
+    bits = 0
+    count = 0
+    for code in codes:
+        bits += code_width(count, max_dict, start)
+        count = 0 if code == max_dict else count + 1
+    return bits
+
+def gamma_length(n):
+    return 2 * n.bit_length() - 1
+
+def delta_length(n):
+    L = n.bit_length()
+    return L - 1 + gamma_length(L)
+
+def omega_length(n):
+    length = 1
+    while n > 1:
+        L = n.bit_length()
+        length += L
+        n = L - 1
+    return length
+
+# position in this list is the method tag in the first byte of the archive, decode.py uses the same order
+CODES = [gamma, delta, omega, fib_encode, binary]
+CODE_LENGTHS = {gamma: gamma_length, delta: delta_length, omega: omega_length, fib_encode: FIBONACCI.length}
+
+def lzw_codes(input_bytes, max_dict=None, policy=FREEZE, preset=None):
+    # phrase = (prefix code, next byte) -> code, single bytes are codes 0-255
+    dictionary = LZWDictionary(max_dict, policy, preset.dictionary if preset else None)
+    lookup = dictionary.lookup
+    codes = []
+
+    P = input_bytes[0]
+
+    for C in memoryview(input_bytes)[1:]:
+        code = lookup.get((P << 8) | C)
+
+        if code is not None:
+            P = code
+        else:
+            codes.append(P)
+            dictionary.touch(P)
+            if policy == RESET and dictionary.is_full():
+                codes.append(dictionary.clear_code)
+                dictionary.reset()
             else:
-                bitstring_output += func(dictionary[P] + 1)
-                dictionary[P + C] = len(dictionary)
-                P = C
-
-        bitstring_output += func(dictionary[P] + 1)
+                dictionary.add(P, C)
+            P = C
+
+    codes.append(P)
+    return codes
+
+def encoded_size(func, histogram):
+    length = CODE_LENGTHS[func]
+    bits = sum(length(code + 1) * count for code, count in histogram.items())
+    if func.__name__ not in ["gamma", "delta"]:
+        bits += 3
+    return (bits + 7) // 8
+
+def cheapest_code(codes, max_dict=None, start=256):
+    histogram = Counter(codes)
+    sizes = {func: encoded_size(func, histogram) for func in CODE_LENGTHS}
+    sizes[binary] = (binary_length(codes, max_dict, start) + 7) // 8
+    return min(sizes, key=sizes.get)
+
+def encode_bytes(data, func=omega, max_dict=None, policy=FREEZE, preset=None):
+    """
+    func=None picks the universal code giving the smallest output for this input.
+    :return: archive with the method tag in the first byte, followed by the preset id if there is one
+             and the max dictionary size if there is one
+    """
+    codes = lzw_codes(data, max_dict, policy, preset)
+    start = len(preset) if preset else 256
+    if func is None:
+        func = cheapest_code(codes, max_dict, start)
+
+    tag = CODES.index(func)
+    header = b""
+    if preset:
+        tag |= FLAG
+        header += preset.id.to_bytes(4, "big")
+    if max_dict is not None:
+        tag |= (POLICIES.index(policy) + 1) << POLICY_SHIFT
+        header += max_dict.to_bytes(4, "big")
+    header = bytes([tag]) + header
+
+    if func is binary:
+        return header + binary(codes, max_dict, start)
+
+    bitstring_output = "".join([func(code + 1) for code in codes])
+
+    if func.__name__ in ["gamma", "delta"]:
+        bitstring_output = bitstring_output.ljust((len(bitstring_output) + 7) // 8 * 8, "0")
+    else:
+        pad_len = (8 - (len(bitstring_output) + 3) % 8) % 8
+        bitstring_output = bin(pad_len)[2:].zfill(3) + bitstring_output + "0" * pad_len
 
-        if func.__name__ in ["gamma", "delta"]:
-            bitstring_output = bitstring_output.ljust((len(bitstring_output) + 7) // 8 * 8, "0")
-        else:
-            pad_len = (8 - (len(bitstring_output) + 3) % 8) % 8
-            bitstring_output = bin(pad_len)[2:].zfill(3) + bitstring_output + "0" * pad_len
+    return header + bytes(int(bitstring_output[i:i + 8], 2) for i in range(0, len(bitstring_output), 8))
 
-        b = bytes(int(bitstring_output[i:i + 8], 2) for i in range(0, len(bitstring_output), 8))
+def encode(input_file, output_file, func=omega, max_dict=None, policy=FREEZE, preset=None):
+    """
+    :return: (input byte histogram, output byte histogram)
+    """
+    with open(input_file, "rb") as inp, open(output_file, "wb") as output:
+        data = inp.read()
+        b = encode_bytes(data, func, max_dict, policy, preset)
         output.write(b)
-        return b
+
+    if func is None:
+        print("Universal code:", CODES[b[0] & CODE_MASK].__name__)
+    return Counter(data), Counter(b)
+
+def encode_chunks(input_file, output_file, func=omega, max_dict=None, policy=FREEZE, chunk_size=container.CHUNK_SIZE, workers=None, preset=None):
+    """
+    Splits the input into chunks, each compressed with a fresh dictionary on a process pool
+    (with func=None every chunk picks its own code), and writes them into a container.
+    :return: (input byte histogram, output byte histogram)
+    """
+    workers = workers or os.cpu_count() or 1
+    data_size = os.path.getsize(input_file)
+    input_freq = Counter()
+    output_freq = Counter()
+
+    def read_chunks(inp):
+        for chunk in iter(lambda: inp.read(chunk_size), b""):
+            input_freq.update(chunk)
+            yield chunk
+
+    with open(output_file, "wb+") as output:
+        with open(input_file, "rb") as inp, ProcessPoolExecutor(workers) as pool:
+            table = container.write_header(output, chunk_size, data_size)
+            chunks = read_chunks(inp)
+            task = functools.partial(encode_bytes, func=func, max_dict=max_dict, policy=policy, preset=preset)
+
+            offsets = []
+            for chunk in container.map_window(pool, task, chunks, 2 * workers):
+                offsets.append(output.tell())
+                output.write(chunk)
+                output_freq.update(chunk)
+
+            container.write_offsets(output, table, offsets)
+        output.seek(0)
+        output_freq.update(output.read(table + 8 * len(offsets)))
+
+    return input_freq, output_freq
 
 def entropy(freq, num_of_symbols):
     H = sum(freq[i] / num_of_symbols * -math.log(freq[i] / num_of_symbols, 2) for i in freq)
     return H
 
-def get_freq(sth):
-    freq = {}
-
-    for symbol in sth:
-        if not symbol:
-            break
-
-        freq[symbol] = freq.get(symbol, 0) + 1
-
-    return freq
-
-def stats(input_file, output):
-    with open(input_file, "rb") as f:
-        inp = f.read()
-        input_len = len(inp)
-        input_freq = get_freq(inp)
-
-    output_len = len(output)
-    output_freq = get_freq(output)
+def stats(input_freq, output_freq):
+    input_len = sum(input_freq.values())
+    output_len = sum(output_freq.values())
 
     print("\nInput:")
     print("   entropy:", entropy(input_freq, input_len))
@@ -105,14 +223,26 @@ def stats(input_file, output):
     print("Compression ratio:", output_len / input_len, "\n")
 
 if __name__ == "__main__":
-    if len(sys.argv) == 3:
-        res = encode(sys.argv[1], sys.argv[2])
-        stats(sys.argv[1], res)
-    elif len(sys.argv) == 4:
-        encoding_functions = {"--delta": delta, "--gamma": gamma, "--omega": omega, "--fib": fib_encode}
-        encoding_function = encoding_functions.get(sys.argv[3], omega)
-
-        res = encode(sys.argv[1], sys.argv[2], encoding_function)
-        stats(sys.argv[1], res)
+    parser = argparse.ArgumentParser(description="LZW compression with universal coding of the output codes")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    coding = parser.add_mutually_exclusive_group()
+    coding.add_argument("--delta", dest="func", action="store_const", const=delta)
+    coding.add_argument("--gamma", dest="func", action="store_const", const=gamma)
+    coding.add_argument("--omega", dest="func", action="store_const", const=omega)
+    coding.add_argument("--fib", dest="func", action="store_const", const=fib_encode)
+    coding.add_argument("--binary", dest="func", action="store_const", const=binary, help="plain binary codes, as wide as the dictionary needs")
+    coding.add_argument("--auto", dest="func", action="store_const", const=None, help="use the universal code giving the smallest output")
+    parser.add_argument("--max-dict", type=int, default=None, help="maximum dictionary size in codes (unlimited by default)")
+    parser.add_argument("--policy", choices=POLICIES, default=FREEZE, help="what to do when the dictionary is full")
+    parser.add_argument("--preset", type=Preset.load, default=None, help="preset dictionary file built with preset.py")
+    parser.add_argument("--chunk-size", type=int, default=None, help="compress independent chunks of this many bytes in parallel")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes for --chunk-size (all cores by default)")
+    parser.set_defaults(func=omega)
+    args = parser.parse_args()
+
+    if args.chunk_size:
+        input_freq, output_freq = encode_chunks(args.input_file, args.output_file, args.func, args.max_dict, args.policy, args.chunk_size, args.workers, args.preset)
     else:
-        print("\ncorrect parameters: <input_file> <output_file> <type_of_coding>\ntype of coding options: --delta --gamma --omega --fib\n")
+        input_freq, output_freq = encode(args.input_file, args.output_file, args.func, args.max_dict, args.policy, args.preset)
+    stats(input_freq, output_freq)
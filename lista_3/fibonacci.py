@@ -0,0 +1,77 @@
+from bisect import bisect_right
+
+class Fibonacci:
+    """
+    Fibonacci (Zeckendorf) code shared by encode.py and decode.py. Bit i of a codeword stands
+    for the i-th term of 1, 1, 2, 3, 5, ... (the first bit is always 0 in this format) and
+    an extra 1 ends it, so "11" only occurs there.
+    The sequence is computed once and only extended when a larger value shows up.
+    """
+
+    def __init__(self, max_value=1 << 16, cache_size=1 << 12):
+        self.sequence = [1, 1]
+        self._extend(max_value)
+        self.cache_size = cache_size
+        self.codewords = {}
+
+    def _extend(self, n):
+        seq = self.sequence
+        while seq[-1] <= n:
+            seq.append(seq[-1] + seq[-2])
+
+    def codeword(self, n):
+        """
+        :return: (codeword bits as an integer, codeword length)
+        """
+        seq = self.sequence
+        if n >= seq[-1]:
+            self._extend(n)
+
+        k = bisect_right(seq, n) - 1
+        value = 1
+        i = k
+        while n:
+            if seq[i] <= n:
+                n -= seq[i]
+                value |= 1 << (k + 1 - i)
+                i -= 2
+            else:
+                i -= 1
+        return value, k + 2
+
+    def length(self, n):
+        if n >= self.sequence[-1]:
+            self._extend(n)
+        return bisect_right(self.sequence, n) + 1
+
+    def encode(self, n):
+        code = self.codewords.get(n)
+        if code is None:
+            value, length = self.codeword(n)
+            code = format(value, f"0{length}b")
+            if n < self.cache_size:
+                self.codewords[n] = code
+        return code
+
+    def decode(self, bits):
+        """
+        Yields the numbers read from a BitReader until its end.
+        """
+        seq = self.sequence
+        while True:
+            n = 0
+            pos = 0
+            last = -2
+            while True:
+                z = bits.zeros()
+                if z is None:
+                    return
+                pos += z
+                if pos == last + 1:
+                    break
+                if pos >= len(seq):
+                    self._extend(seq[-1] + 1)
+                n += seq[pos]
+                last = pos
+                pos += 1
+            yield n
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+
+FREEZE = "freeze"
+RESET = "reset"
+LRU = "lru"
+POLICIES = [FREEZE, RESET, LRU]
+
+# method tag of an archive: bits 0-4 are the index in CODES, bits 5-6 are 0 for an unlimited dictionary,
+# otherwise the index in POLICIES + 1 with the max size (4 B) at the end of the header, bit 7 is preset.FLAG
+CODE_MASK = 0x1F
+POLICY_SHIFT = 5
+
+class LZWDictionary:
+    """
+    LZW dictionary shared by encode.py and decode.py, so both sides apply the size limit
+    in lockstep. Codes 0-255 are single bytes, every other code is (prefix code, last byte)
+    with the length of the whole phrase.
+
+    With max_size set, a full dictionary behaves according to policy:
+      freeze - no more entries are added,
+      reset  - the encoder emits clear_code and both sides start over from 256 entries,
+      lru    - the least recently used entry without children is evicted and its code reused.
+
+    With base given (a preset dictionary) every start and reset begins from a copy of it.
+    """
+
+    def __init__(self, max_size=None, policy=FREEZE, base=None):
+        start = 256 if base is None else len(base)
+        if max_size is not None and max_size <= start:
+            raise ValueError(f"max dictionary size must be greater than {start}")
+        if policy not in POLICIES:
+            raise ValueError(f"unknown dictionary policy: {policy}")
+
+        self.max_size = max_size
+        self.policy = policy
+        self.base = base
+        self.lookup = {}  # (prefix << 8) | byte -> code, used by the encoder
+        self.prefix = []
+        self.last_byte = []
+        self.length = []
+        self.children = []
+        self.leaves = OrderedDict()  # codes without children, least recently used first
+        self.reset()
+
+    @property
+    def clear_code(self):
+        return self.max_size
+
+    def reset(self):
+        if self.base is not None:
+            self._copy(self.base)
+            return
+
+        self.lookup.clear()
+        self.prefix[:] = [-1] * 256
+        self.last_byte[:] = range(256)
+        self.length[:] = [1] * 256
+        self.children[:] = [0] * 256
+        self.leaves.clear()
+        self.next_code = 256
+
+    def _copy(self, other):
+        self.lookup.clear()
+        self.lookup.update(other.lookup)
+        self.prefix[:] = other.prefix
+        self.last_byte[:] = other.last_byte
+        self.length[:] = other.length
+        self.children[:] = other.children
+        self.leaves.clear()
+        if self.policy == LRU:  # only eviction looks at the leaves
+            self.leaves.update(other.leaves)
+        self.next_code = other.next_code
+
+    def __len__(self):
+        return self.next_code
+
+    def is_full(self):
+        return self.max_size is not None and self.next_code >= self.max_size
+
+    def next_slot(self, prefix):
+        """
+        Code the next add(prefix, ...) will assign, or None if nothing would be added.
+        """
+        if not self.is_full():
+            return self.next_code
+        if self.policy != LRU:
+            return None
+        for code in self.leaves:
+            if code != prefix:
+                return code
+        return None
+
+    def add(self, prefix, byte):
+        """
+        :return: code assigned to the new phrase or None if the dictionary is full
+        """
+        code = self.next_slot(prefix)
+        if code is None:
+            return None
+
+        if code == self.next_code:
+            self.prefix.append(prefix)
+            self.last_byte.append(byte)
+            self.length.append(self.length[prefix] + 1)
+            self.children.append(0)
+            self.next_code += 1
+        else:
+            self._evict(code)
+            self.prefix[code] = prefix
+            self.last_byte[code] = byte
+            self.length[code] = self.length[prefix] + 1
+
+        self.lookup[(prefix << 8) | byte] = code
+        self.children[prefix] += 1
+        self.leaves.pop(prefix, None)
+        self.leaves[code] = None
+        return code
+
+    def _evict(self, code):
+        old_prefix = self.prefix[code]
+        del self.lookup[(old_prefix << 8) | self.last_byte[code]]
+        del self.leaves[code]
+
+        self.children[old_prefix] -= 1
+        if old_prefix >= 256 and not self.children[old_prefix]:
+            self.leaves[old_prefix] = None
+
+    def touch(self, code):
+        if self.policy == LRU and code in self.leaves:
+            self.leaves.move_to_end(code)
+
+def code_width(count, max_size=None, start=256):
+    """
+    Width in bits of a code in binary mode, count being the number of codes emitted since the start
+    or the last clear code. The dictionary holds min(start + count, max_size) entries then, so the widest
+    possible code, the clear code (= max_size) included, always fits.
+    """
+    size = start + count
+    if max_size is not None and size > max_size:
+        size = max_size
+    return size.bit_length()
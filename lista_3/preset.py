@@ -0,0 +1,95 @@
+import zlib
+import argparse
+from lzw_dictionary import LZWDictionary
+
+MAGIC = b"LZWP"
+FLAG = 0x80  # set in the method tag of an archive whose header goes on with the 4-byte preset id
+
+# preset file: MAGIC, number of entries (4 B), then (prefix code (3 B), last byte (1 B)) for codes 256, 257, ...
+
+class Preset:
+    """
+    Preset dictionary of common phrases, both sides start from it instead of the 256 single bytes.
+    Archives refer to it by id, the CRC32 of its entry table.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.id = zlib.crc32(self.table())
+        self.dictionary = LZWDictionary()
+        for prefix, byte in entries:
+            self.dictionary.add(prefix, byte)
+
+    def __len__(self):
+        return len(self.dictionary)
+
+    def table(self):
+        return b"".join(prefix.to_bytes(3, "big") + bytes([byte]) for prefix, byte in self.entries)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(self.entries).to_bytes(4, "big"))
+            f.write(self.table())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"not an LZW preset dictionary: {path}")
+            count = int.from_bytes(f.read(4), "big")
+            raw = f.read(4 * count)
+        return cls([(int.from_bytes(raw[i:i + 3], "big"), raw[i + 3]) for i in range(0, len(raw), 4)])
+
+    @classmethod
+    def train(cls, data, size=4096):
+        """
+        Runs LZW over the corpus and keeps the size - 256 phrases the encoder walked through most often.
+        The encoder only reaches a phrase through its prefix, so a prefix is walked through at least as
+        often as any of its extensions and also has a lower code. Sorting by (-hits, code) therefore puts
+        every prefix ahead of its extensions, and the kept phrases always include their prefixes.
+        """
+        if size <= 256:
+            raise ValueError(f"preset size must be more than the 256 single bytes, got {size}")
+        dictionary = LZWDictionary()
+        lookup = dictionary.lookup
+        hits = [0] * 256
+
+        P = data[0]
+        for C in memoryview(data)[1:]:
+            code = lookup.get((P << 8) | C)
+            if code is not None:
+                hits[code] += 1
+                P = code
+            else:
+                dictionary.add(P, C)
+                hits.append(0)
+                P = C
+
+        chosen = sorted(range(256, len(dictionary)), key=lambda code: (-hits[code], code))[:size - 256]
+        chosen.sort()
+        renumber = {code: code for code in range(256)}
+        entries = []
+        for code in chosen:
+            renumber[code] = 256 + len(entries)
+            entries.append((renumber[dictionary.prefix[code]], dictionary.last_byte[code]))
+        return cls(entries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an LZW preset dictionary from a training corpus")
+    parser.add_argument("output_file")
+    parser.add_argument("corpus", nargs="+")
+    parser.add_argument("--size", type=int, default=4096, help="dictionary size in codes, single bytes included")
+    args = parser.parse_args()
+    if args.size <= 256:
+        parser.error("--size must be more than 256, the single bytes are always included")
+
+    corpus = []
+    for path in args.corpus:
+        with open(path, "rb") as f:
+            corpus.append(f.read())
+    data = b"".join(corpus)
+
+    preset = Preset.train(data, args.size)
+    preset.save(args.output_file)
+    print(f"Preset {preset.id:08x}: {len(preset.entries)} phrases")
@@ -1,8 +1,21 @@
+import os
 import sys
+import csv
+import glob
+import json
+import hashlib
 from math import log2
 from typing import List
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+
+import loco_i
+
+TGA_IMAGE_HEADER: int = 18
 TGA_IMAGE_FOOTER: int = 26
+TOOL_VERSION: str = "1"  # bump whenever the analysis results change, it invalidates the batch cache
+CACHE_DIR: str = ".jpeg-ls-cache"
 
 class ColorPixel:
     def __init__(self, red: int, green: int, blue: int):
@@ -16,7 +29,8 @@ class ColorPixel:
 class ImageAnalysis:
     def __init__(self, width: int, height: int):
         self.width = width
-        self.pixel_matrix = [[ColorPixel(0, 0, 0) for _ in range(height)] for _ in range(width)]
+        self.height = height
+        self.pixels = np.zeros((height, width, 3), dtype=np.uint8)  # [y, x, channel], channels RGB
         self.rgb_matrix = [[0] * 256 for _ in range(3)]
         self.rgb_counts = [0] * 3
         self.significant_counts = [0] * 256
@@ -30,13 +44,31 @@ class ImageAnalysis:
 
     def add_pixel(self, red: int, green: int, blue: int):
         x = self.index_x % self.width
-        self.pixel_matrix[x][self.index_y] = ColorPixel(red, green, blue)
+        self.pixels[self.index_y, x] = (red, green, blue)
         if self.index_x == self.width - 1:
             self.index_y += 1
         self.index_x = x + 1
 
+    def load_pixels(self, byte_array, offset: int, count: int):
+        """Same as add_pixel and the increase_* counters for count BGR pixels starting at offset, in one go."""
+        bgr = np.frombuffer(byte_array, dtype=np.uint8, count=3 * count, offset=offset).reshape(-1, 3)
+        start = self.index_y * self.width + self.index_x % self.width
+        self.pixels.reshape(-1, 3)[start:start + count] = bgr[:, ::-1]
+        self.index_y, self.index_x = divmod(start + count, self.width)
+
+        for channel in range(3):
+            histogram = np.bincount(bgr[:, 2 - channel], minlength=256).tolist()
+            self.rgb_counts[channel] += count
+            self.rgb_matrix[channel] = [a + b for a, b in zip(self.rgb_matrix[channel], histogram)]
+            self.significant_counts = [a + b for a, b in zip(self.significant_counts, histogram)]
+
+    def get_channel(self, channel: int, x: int, y: int) -> int:
+        return int(self.pixels[y, x, channel])
+
     def get_adjacent_pixel(self, i: int, j: int):
-        return self.pixel_matrix[i][j] if 0 <= i < len(self.pixel_matrix) and 0 <= j < len(self.pixel_matrix[0]) else ColorPixel(0, 0, 0)
+        if 0 <= i < self.width and 0 <= j < self.height:
+            return ColorPixel(*(int(value) for value in self.pixels[j, i]))
+        return ColorPixel(0, 0, 0)
 
     def increase_rgb_counts(self, red: int, green: int, blue: int):
         self.rgb_counts[0] += 1
@@ -84,54 +116,144 @@ def create_predicates():
     ]
 
 def new_standard(x, y, z):
-    maximum = max(y, z)
-    return maximum if x > maximum else min(y, z) if x <= min(y, z) else z + y - x
+    maximum = np.maximum(y, z)
+    minimum = np.minimum(y, z)
+    return np.where(x > maximum, maximum, np.where(x <= minimum, minimum, z + y - x))
+
+def mod_256(x):
+    return x % 256
 
-def mod_256(x: int):
-    value: int = x % 256
-    return value & 0xFF if value < 0 else value
+def neighbour_planes(pixels: np.ndarray):
+    """A (above), B (left) and C (above left) of every pixel, zero outside the image."""
+    padded = np.pad(pixels.astype(np.int16), ((1, 0), (1, 0), (0, 0)))
+    return padded[:-1, 1:], padded[1:, :-1], padded[:-1, :-1]
 
-def analyze_image(image_analysis: ImageAnalysis):
-    predicates = create_predicates()
+def residual_entropies(residuals: np.ndarray) -> List:
+    counts = [np.bincount(residuals[:, :, channel].ravel(), minlength=256) for channel in range(3)]
+    size = residuals.shape[0] * residuals.shape[1]
+    return [
+        compute_entropy(counts[0].tolist(), size),  # Red
+        compute_entropy(counts[1].tolist(), size),  # Green
+        compute_entropy(counts[2].tolist(), size),  # Blue
+        compute_entropy((counts[0] + counts[1] + counts[2]).tolist(), 3 * size)
+    ]
+
+def predictor_residuals(pixels: np.ndarray):
+    """Yields the residuals of every predictor from create_predicates, as uint8 arrays shaped like pixels."""
+    current = pixels.astype(np.int16)
+    adjacent_a, adjacent_b, adjacent_c = neighbour_planes(pixels)
+    for predicate in create_predicates():
+        predicted = np.asarray(predicate(adjacent_c, adjacent_b, adjacent_a)).astype(np.int16)
+        yield mod_256(current - predicted).astype(np.uint8)
+
+def analyze_image(pixels: np.ndarray):
     best_entropy = [sys.maxsize] * 4
     best_func = [sys.maxsize] * 4
 
-    for i, predicate in enumerate(predicates):
-        image_analysis.clear_data()
-        for j, row in enumerate(image_analysis.pixel_matrix):
-            for k, pixel in enumerate(row):
-                current_pixel = pixel
-                adjacent_pixel_a = image_analysis.get_adjacent_pixel(j, k - 1)
-                adjacent_pixel_b = image_analysis.get_adjacent_pixel(j - 1, k)
-                adjacent_pixel_c = image_analysis.get_adjacent_pixel(j - 1, k - 1)
-
-                predicted_red = mod_256(current_pixel.red - int(predicate(adjacent_pixel_c.red, adjacent_pixel_b.red, adjacent_pixel_a.red)))
-                predicted_green = mod_256(current_pixel.green - int(predicate(adjacent_pixel_c.green, adjacent_pixel_b.green, adjacent_pixel_a.green)))
-                predicted_blue = mod_256(current_pixel.blue - int(predicate(adjacent_pixel_c.blue, adjacent_pixel_b.blue, adjacent_pixel_a.blue)))
-
-                image_analysis.increase_rgb_counts(predicted_red, predicted_green, predicted_blue)
-                image_analysis.increase_significant_counts(predicted_red, predicted_green, predicted_blue)
-
-        current_entropy = [
-            compute_entropy(image_analysis.rgb_matrix[0], image_analysis.rgb_counts[0]),  # Red
-            compute_entropy(image_analysis.rgb_matrix[1], image_analysis.rgb_counts[1]),  # Green
-            compute_entropy(image_analysis.rgb_matrix[2], image_analysis.rgb_counts[2]),  # Blue
-            compute_entropy(image_analysis.significant_counts, image_analysis.get_total_significant_counts())
-        ]
+    for i, residuals in enumerate(predictor_residuals(pixels)):
+        current_entropy = residual_entropies(residuals)
 
         print(f"{i}: total: {current_entropy[3]}")
         print(f"{i}: red  : {current_entropy[0]}")
         print(f"{i}: green: {current_entropy[1]}")
         print(f"{i}: blue : {current_entropy[2]}")
 
-        for j in range(len(best_entropy)):
-            if current_entropy[j] < best_entropy[j]:
-                best_entropy[j] = current_entropy[j]
-                best_func[j] = i
+        update_best_results(i, current_entropy, best_entropy, best_func)
     print("")
 
     print_final_results(best_entropy, best_func)
 
+def tile_costs(residuals: np.ndarray, tile_id: np.ndarray, tiles: int, code_length: np.ndarray = None) -> np.ndarray:
+    """
+    (tiles, 3) cost of coding each tile and channel: bits under the given code length of every residual value,
+    or the sum of |residual| without one.
+    """
+    costs = np.empty((tiles, 3))
+    for channel in range(3):
+        values = residuals[:, :, channel].ravel()
+        if code_length is None:
+            weights = np.minimum(values, 256 - values.astype(np.int16))
+        else:
+            weights = code_length[values]
+        costs[:, channel] = np.bincount(tile_id, weights=weights, minlength=tiles)
+    return costs
+
+def select_predictors(residuals: List[np.ndarray], tile_id: np.ndarray, tiles: int, start: int, code_length: np.ndarray = None):
+    """
+    Every tile starts with predictor `start` and switches only to a strictly cheaper one, so ties keep it.
+    :return: (tiles, 3) index of the cheapest predictor, residuals of the chosen predictors
+    """
+    height, width = residuals[start].shape[:2]
+    best_cost = tile_costs(residuals[start], tile_id, tiles, code_length)
+    predictor_map = np.full((tiles, 3), start, dtype=np.int64)
+    chosen = residuals[start].copy()
+
+    for i, current in enumerate(residuals):
+        if i == start:
+            continue
+        costs = tile_costs(current, tile_id, tiles, code_length)
+
+        better = costs < best_cost
+        best_cost[better] = costs[better]
+        predictor_map[better] = i
+        for channel in range(3):
+            mask = better[tile_id, channel].reshape(height, width)
+            chosen[:, :, channel][mask] = current[:, :, channel][mask]
+
+    return predictor_map, chosen
+
+def analyze_tiles(pixels: np.ndarray, tile_size: int = 32, cost: str = "entropy", passes: int = 3):
+    """
+    Picks a predictor for every tile_size x tile_size tile and channel, starting from the best single predictor
+    for the whole image. The "abs" cost is the sum of |residual|. "entropy" then, for a few passes, picks
+    the predictor needing the fewest bits under the residual histogram of the whole image, so it lowers
+    the combined entropy rather than the entropy of each small tile on its own.
+    If the tiles come out worse than the single predictor, the single predictor is returned for every tile.
+    :return: (predictor map of shape (tile rows, tile columns, 3), [red, green, blue, total] entropy of the result,
+              the same entropies for the best single predictor)
+    """
+    if cost not in ("entropy", "abs"):
+        raise ValueError(f"Error: unknown cost {cost}!")
+
+    height, width = pixels.shape[:2]
+    rows, columns = -(-height // tile_size), -(-width // tile_size)
+    tile_id = ((np.arange(height) // tile_size)[:, None] * columns + (np.arange(width) // tile_size)[None, :]).ravel()
+
+    residuals = list(predictor_residuals(pixels))
+    entropies = [residual_entropies(r) for r in residuals]
+    best = min(range(len(residuals)), key=lambda i: entropies[i][3])
+    global_entropy = entropies[best]
+
+    if cost == "abs":
+        predictor_map, chosen = select_predictors(residuals, tile_id, rows * columns, best)
+    else:
+        chosen = residuals[best]
+        for _ in range(passes):
+            counts = np.bincount(chosen.ravel(), minlength=256) + 1
+            code_length = np.log2(counts.sum()) - np.log2(counts)
+            predictor_map, chosen = select_predictors(residuals, tile_id, rows * columns, best, code_length)
+
+    tile_entropy = residual_entropies(chosen)
+    if tile_entropy[3] > global_entropy[3]:
+        return np.full((rows, columns, 3), best, dtype=np.int64), global_entropy, global_entropy
+    return predictor_map.reshape(rows, columns, 3), tile_entropy, global_entropy
+
+def print_tile_results(predictor_map: np.ndarray, tile_entropy: List, global_entropy: List):
+    for channel, name in enumerate(["Red", "Green", "Blue"]):
+        print(f"{name} predictor map:")
+        for row in predictor_map[:, :, channel]:
+            print("".join(str(p) for p in row))
+        print("")
+    print("Tiles  total: ", tile_entropy[3], "  global: ", global_entropy[3])
+    print("Tiles  red  : ", tile_entropy[0], "  global: ", global_entropy[0])
+    print("Tiles  green: ", tile_entropy[1], "  global: ", global_entropy[1])
+    print("Tiles  blue : ", tile_entropy[2], "  global: ", global_entropy[2])
+
+def tiles_function(file_name: str, tile_size: int = 32, cost: str = "entropy"):
+    pixels = load_image(file_name).pixels
+    predictor_map, tile_entropy, global_entropy = analyze_tiles(pixels, tile_size, cost)
+    print_tile_results(predictor_map, tile_entropy, global_entropy)
+
 def update_best_results(func_idx: int, current_entropy: List, best_entropy: List, best_func):
     for i in range(len(best_entropy)):
         if current_entropy[i] < best_entropy[i]:
@@ -154,8 +276,13 @@ def print_final_results(best_results: List, best_func: List):
     print("Best green [", best_func[1], "] : ", best_results[1])
     print("Best blue  [", best_func[2], "] : ", best_results[2])
 
-def main_function(file_name: str):
-    data_collector = DataCollector(read_bytes_from_file(file_name))
+def load_image(file_name: str) -> ImageAnalysis:
+    return parse_image(read_bytes_from_file(file_name))
+
+def parse_image(byte_array) -> ImageAnalysis:
+    if len(byte_array) < TGA_IMAGE_HEADER:
+        raise ValueError('Error: file shorter than the TGA header!')
+    data_collector = DataCollector(byte_array)
     for _ in range(12):
         data_collector.read_byte()
 
@@ -173,21 +300,126 @@ def main_function(file_name: str):
     if is_uncompressed and data_collector.byte_array[16] == 0x20:
         raise ValueError('Error: RGBA not RGB!')
     elif is_uncompressed and data_collector.byte_array[16] == 0x18:
-        for _ in range(image_size):
-            blue = int(data_collector.read_byte())
-            green = int(data_collector.read_byte())
-            red = int(data_collector.read_byte())
-            image_analysis.add_pixel(red, green, blue)
-            image_analysis.increase_rgb_counts(red, green, blue)
-            image_analysis.increase_significant_counts(red, green, blue)
+        if len(byte_array) < data_collector.offset + 3 * image_size:
+            raise ValueError('Error: pixel data is truncated!')
+        image_analysis.load_pixels(data_collector.byte_array, data_collector.offset, image_size)
     else:
         raise ValueError('Error: already compressed!')
 
+    return image_analysis
+
+def main_function(file_name: str):
+    image_analysis = load_image(file_name)
     show_data_analysis(image_analysis)
-    analyze_image(image_analysis)
+    analyze_image(image_analysis.pixels)
+
+def encode_function(input_file: str, output_file: str):
+    compressed_bits = 8 * loco_i.encode(input_file, output_file)
+    with open(input_file, "rb") as inp:
+        _, width, height = loco_i.read_tga_header(inp)
+    if not width * height:
+        return
+    print("LOCO-I codec : ", compressed_bits / (width * height), "bits per pixel")
+    print("Per channel  : ", compressed_bits / (3 * width * height), "bits per sample")
+
+def image_entropies(image_analysis: ImageAnalysis) -> List:
+    return [
+        compute_entropy(image_analysis.rgb_matrix[0], image_analysis.rgb_counts[0]),
+        compute_entropy(image_analysis.rgb_matrix[1], image_analysis.rgb_counts[1]),
+        compute_entropy(image_analysis.rgb_matrix[2], image_analysis.rgb_counts[2]),
+        compute_entropy(image_analysis.significant_counts, image_analysis.get_total_significant_counts())
+    ]
+
+def analyze_file(file_name: str, cache_dir: str = CACHE_DIR):
+    """
+    Batch worker: [red, green, blue, total] entropies of the image and of every predictor's residuals.
+    Results are cached in cache_dir under the hash of the file content and TOOL_VERSION.
+    :return: (result, whether it came from the cache)
+    """
+    try:
+        byte_array = read_bytes_from_file(file_name)
+    except OSError as error:
+        return {"error": str(error)}, False  # not cached: the file may be readable on the next run
+    key = hashlib.sha256(TOOL_VERSION.encode() + b"\0" + bytes(byte_array)).hexdigest()
+    cache_file = os.path.join(cache_dir, key + ".json")
+    try:
+        with open(cache_file) as f:
+            return json.load(f), True
+    except (OSError, ValueError):
+        pass  # not cached yet, or a broken entry which gets rewritten below
+
+    try:
+        image_analysis = parse_image(byte_array)
+        predictors = [residual_entropies(residuals) for residuals in predictor_residuals(image_analysis.pixels)]
+        result = {
+            "width": image_analysis.width,
+            "height": image_analysis.height,
+            "image": image_entropies(image_analysis),
+            "predictors": predictors,
+            "best": [min(range(len(predictors)), key=lambda i: predictors[i][j]) for j in range(4)],
+        }
+    except ValueError as error:
+        result = {"error": str(error)}
+
+    # files with the same content share a key, so every writer needs its own temporary file
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as f:
+        json.dump(result, f)
+    os.replace(temp_file, cache_file)
+    return result, False
+
+def batch_files(pattern: str) -> List[str]:
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "**", "*.tga")
+    return sorted(f for f in glob.glob(pattern, recursive=True) if os.path.isfile(f))
+
+def write_report(report_file: str, results: List):
+    if report_file.endswith(".csv"):
+        with open(report_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "predictor", "red", "green", "blue", "total", "error"])
+            for result in results:
+                if "error" in result:
+                    writer.writerow([result["file"], "", "", "", "", "", result["error"]])
+                    continue
+                writer.writerow([result["file"], "image", *result["image"], ""])
+                for i, entropies in enumerate(result["predictors"]):
+                    writer.writerow([result["file"], i, *entropies, ""])
+    else:
+        with open(report_file, "w") as f:
+            json.dump({"version": TOOL_VERSION, "files": results}, f, indent=1)
+
+def batch_function(pattern: str, report_file: str, cache_dir: str = CACHE_DIR, workers: int = None):
+    files = batch_files(pattern)
+    results = []
+    cached = 0
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        for file_name, (result, from_cache) in zip(files, pool.map(analyze_file, files, [cache_dir] * len(files), chunksize=4)):
+            results.append({"file": file_name, **result})
+            cached += from_cache
+
+    write_report(report_file, results)
+    errors = sum("error" in result for result in results)
+    print(f"{len(files)} files, {cached} from cache, {errors} errors -> {report_file}")
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
+    if len(sys.argv) == 4 and sys.argv[1] == "encode":
+        encode_function(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 4 and sys.argv[1] == "decode":
+        loco_i.decode(sys.argv[2], sys.argv[3])
+    elif 3 <= len(sys.argv) <= 5 and sys.argv[1] == "tiles":
+        tile_size = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+        cost = sys.argv[4] if len(sys.argv) > 4 else "entropy"
+        tiles_function(sys.argv[2], tile_size, cost)
+    elif 4 <= len(sys.argv) <= 5 and sys.argv[1] == "batch":
+        batch_function(*sys.argv[2:])
+    elif len(sys.argv) == 2:
+        main_function(sys.argv[1])
+    else:
         print("Error: wrong args! Usage: python jpeg-ls.py <tga_file>")
+        print("                          python jpeg-ls.py encode <tga_file> <output_file>")
+        print("                          python jpeg-ls.py decode <input_file> <tga_file>")
+        print("                          python jpeg-ls.py tiles <tga_file> [tile_size] [entropy|abs]")
+        print("                          python jpeg-ls.py batch <directory|glob> <report.json|report.csv> [cache_dir]")
         sys.exit(1)
-    main_function(sys.argv[1])
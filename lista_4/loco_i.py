@@ -0,0 +1,411 @@
+import io
+from typing import List, Tuple
+
+MAGIC: bytes = b"LOCO"
+TGA_HEADER_SIZE: int = 18
+
+# JPEG-LS parameters for 8-bit samples, lossless (NEAR = 0)
+MAXVAL: int = 255
+RANGE: int = 256
+QBPP: int = 8
+LIMIT: int = 32
+T1, T2, T3 = 3, 7, 21
+RESET: int = 64
+MIN_C, MAX_C = -128, 127
+RUN_CONTEXT: int = 365  # 365 and 366 are the run interruption contexts, 1..364 the regular ones
+J: List[int] = [0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+
+def quantize_gradient(d: int) -> int:
+    if d <= -T3:
+        return -4
+    if d <= -T2:
+        return -3
+    if d <= -T1:
+        return -2
+    if d < 0:
+        return -1
+    if d == 0:
+        return 0
+    if d < T1:
+        return 1
+    if d < T2:
+        return 2
+    if d < T3:
+        return 3
+    return 4
+
+QUANTIZE: List[int] = [quantize_gradient(d) for d in range(-MAXVAL, MAXVAL + 1)]
+
+class ComponentState:
+    """Context statistics of one colour component: A, B, C, N per context, Nn and RUNindex for run mode."""
+
+    def __init__(self):
+        self.A = [max(2, (RANGE + 32) >> 6)] * (RUN_CONTEXT + 2)
+        self.B = [0] * (RUN_CONTEXT + 2)
+        self.C = [0] * (RUN_CONTEXT + 2)
+        self.N = [1] * (RUN_CONTEXT + 2)
+        self.Nn = [0] * (RUN_CONTEXT + 2)
+        self.run_index = 0
+
+class BitWriter:
+    def __init__(self, output):
+        self.output = output
+        self.acc = 0
+        self.nbits = 0
+        self.buffer = bytearray()
+
+    def write(self, value: int, n: int):
+        self.acc = (self.acc << n) | value
+        self.nbits += n
+        if self.nbits >= 64:
+            nbytes = self.nbits >> 3
+            self.nbits &= 7
+            self.buffer += (self.acc >> self.nbits).to_bytes(nbytes, "big")
+            self.acc &= (1 << self.nbits) - 1
+            if len(self.buffer) >= 1 << 16:
+                self.output.write(self.buffer)
+                self.buffer = bytearray()
+
+    def flush(self):
+        if self.nbits:
+            self.write(0, -self.nbits % 8)
+            self.buffer += self.acc.to_bytes(self.nbits >> 3, "big")
+            self.acc = self.nbits = 0
+        self.output.write(self.buffer)
+        self.buffer = bytearray()
+
+class BitReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.index = 0
+        self.acc = 0
+        self.nbits = 0
+
+    def _refill(self):
+        chunk = self.data[self.index:self.index + 8]
+        if not chunk:
+            raise EOFError("truncated LOCO-I stream")
+        self.acc = (self.acc << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+        self.nbits += 8 * len(chunk)
+        self.index += len(chunk)
+
+    def read(self, n: int) -> int:
+        while self.nbits < n:
+            self._refill()
+        self.nbits -= n
+        value = self.acc >> self.nbits
+        self.acc &= (1 << self.nbits) - 1
+        return value
+
+    def zeros(self) -> int:
+        """Number of 0 bits before the next 1, both consumed."""
+        count = 0
+        while not self.acc:
+            count += self.nbits
+            self.nbits = 0
+            self._refill()
+        length = self.acc.bit_length()
+        count += self.nbits - length
+        self.nbits = length - 1
+        self.acc &= (1 << self.nbits) - 1
+        return count
+
+def write_golomb(bits: BitWriter, m: int, k: int, limit: int):
+    high = m >> k
+    if high < limit - QBPP - 1:
+        bits.write((1 << k) | (m & ((1 << k) - 1)), high + 1 + k)
+    else:
+        bits.write(1, limit - QBPP)
+        bits.write(m - 1, QBPP)
+
+def read_golomb(bits: BitReader, k: int, limit: int) -> int:
+    high = bits.zeros()
+    if high < limit - QBPP - 1:
+        return (high << k) | bits.read(k)
+    return bits.read(QBPP) + 1
+
+def reduce_error(errval: int) -> int:
+    if errval < 0:
+        errval += RANGE
+    if errval >= (RANGE + 1) // 2:
+        errval -= RANGE
+    return errval
+
+def update_context(state: ComponentState, q: int, errval: int):
+    A, B, C, N = state.A, state.B, state.C, state.N
+    B[q] += errval
+    A[q] += abs(errval)
+    if N[q] == RESET:
+        A[q] >>= 1
+        B[q] >>= 1
+        N[q] >>= 1
+    N[q] += 1
+
+    # bias correction
+    if B[q] <= -N[q]:
+        B[q] += N[q]
+        if C[q] > MIN_C:
+            C[q] -= 1
+        if B[q] <= -N[q]:
+            B[q] = -N[q] + 1
+    elif B[q] > 0:
+        B[q] -= N[q]
+        if C[q] < MAX_C:
+            C[q] += 1
+        if B[q] > 0:
+            B[q] = 0
+
+def regular_context(a: int, b: int, c: int, d: int) -> Tuple[int, int, int]:
+    """:return: (context index, sign, MED prediction), context 0 means run mode"""
+    q1 = QUANTIZE[d - b + MAXVAL]
+    q2 = QUANTIZE[b - c + MAXVAL]
+    q3 = QUANTIZE[c - a + MAXVAL]
+    sign = 1
+    if q1 < 0 or (q1 == 0 and (q2 < 0 or (q2 == 0 and q3 < 0))):
+        q1, q2, q3 = -q1, -q2, -q3
+        sign = -1
+
+    if c >= max(a, b):
+        prediction = min(a, b)
+    elif c <= min(a, b):
+        prediction = max(a, b)
+    else:
+        prediction = a + b - c
+    return 81 * q1 + 9 * q2 + q3, sign, prediction
+
+def corrected_prediction(state: ComponentState, q: int, sign: int, prediction: int) -> int:
+    prediction += state.C[q] if sign > 0 else -state.C[q]
+    return min(max(prediction, 0), MAXVAL)
+
+def golomb_k(n: int, a: int) -> int:
+    k = 0
+    while (n << k) < a:
+        k += 1
+    return k
+
+def interruption_params(state: ComponentState, a: int, b: int) -> Tuple[int, int, int]:
+    """:return: (run interruption type, context index, Golomb parameter)"""
+    ritype = 1 if a == b else 0
+    q = RUN_CONTEXT + ritype
+    temp = state.A[q] + (state.N[q] >> 1) if ritype else state.A[q]
+    return ritype, q, golomb_k(state.N[q], temp)
+
+def update_interruption(state: ComponentState, q: int, ritype: int, errval: int, emerrval: int):
+    if errval < 0:
+        state.Nn[q] += 1
+    state.A[q] += (emerrval + 1 - ritype) >> 1
+    if state.N[q] == RESET:
+        state.A[q] >>= 1
+        state.N[q] >>= 1
+        state.Nn[q] >>= 1
+    state.N[q] += 1
+
+def encode_row(cur: List[int], prev: List[int], c0: int, state: ComponentState, bits: BitWriter):
+    width = len(cur)
+    x = 0
+    while x < width:
+        b = prev[x]
+        a, c = (cur[x - 1], prev[x - 1]) if x else (b, c0)
+        d = prev[x + 1] if x + 1 < width else b
+        q, sign, prediction = regular_context(a, b, c, d)
+
+        if q == 0:
+            x = encode_run(cur, prev, x, a, state, bits)
+            continue
+
+        prediction = corrected_prediction(state, q, sign, prediction)
+        errval = reduce_error(sign * (cur[x] - prediction))
+        k = golomb_k(state.N[q], state.A[q])
+        if k == 0 and 2 * state.B[q] <= -state.N[q]:
+            m = 2 * errval + 1 if errval >= 0 else -2 * (errval + 1)
+        else:
+            m = 2 * errval if errval >= 0 else -2 * errval - 1
+        write_golomb(bits, m, k, LIMIT)
+        update_context(state, q, errval)
+        x += 1
+
+def encode_run(cur: List[int], prev: List[int], x: int, run_value: int, state: ComponentState, bits: BitWriter) -> int:
+    width = len(cur)
+    start = x
+    while x < width and cur[x] == run_value:
+        x += 1
+    count = x - start
+
+    while count >= 1 << J[state.run_index]:
+        bits.write(1, 1)
+        count -= 1 << J[state.run_index]
+        if state.run_index < 31:
+            state.run_index += 1
+    if x == width:
+        if count:
+            bits.write(1, 1)
+        return x
+    bits.write(count, 1 + J[state.run_index])
+
+    # run interruption sample
+    a, b = run_value, prev[x]
+    ritype, q, k = interruption_params(state, a, b)
+    errval = cur[x] - (a if ritype else b)
+    if not ritype and a > b:
+        errval = -errval
+    errval = reduce_error(errval)
+
+    n, nn = state.N[q], state.Nn[q]
+    if k == 0 and 2 * nn < n:
+        mapping = 1 if errval > 0 else 0
+    else:
+        mapping = 1 if errval < 0 else 0
+    emerrval = 2 * abs(errval) - ritype - mapping
+    write_golomb(bits, emerrval, k, LIMIT - J[state.run_index] - 1)
+    update_interruption(state, q, ritype, errval, emerrval)
+    if state.run_index > 0:
+        state.run_index -= 1
+    return x + 1
+
+def decode_row(prev: List[int], c0: int, state: ComponentState, bits: BitReader) -> List[int]:
+    width = len(prev)
+    cur: List[int] = []
+    x = 0
+    while x < width:
+        b = prev[x]
+        a, c = (cur[x - 1], prev[x - 1]) if x else (b, c0)
+        d = prev[x + 1] if x + 1 < width else b
+        q, sign, prediction = regular_context(a, b, c, d)
+
+        if q == 0:
+            x = decode_run(cur, prev, x, a, state, bits)
+            continue
+
+        prediction = corrected_prediction(state, q, sign, prediction)
+        k = golomb_k(state.N[q], state.A[q])
+        m = read_golomb(bits, k, LIMIT)
+        if k == 0 and 2 * state.B[q] <= -state.N[q]:
+            errval = (m - 1) >> 1 if m & 1 else -(m >> 1) - 1
+        else:
+            errval = -((m + 1) >> 1) if m & 1 else m >> 1
+        update_context(state, q, errval)
+
+        cur.append((prediction + sign * errval) % RANGE)
+        x += 1
+    return cur
+
+def decode_run(cur: List[int], prev: List[int], x: int, run_value: int, state: ComponentState, bits: BitReader) -> int:
+    width = len(prev)
+    while True:
+        if bits.read(1):
+            segment = 1 << J[state.run_index]
+            count = min(segment, width - x)
+            cur.extend([run_value] * count)
+            x += count
+            if count == segment and state.run_index < 31:
+                state.run_index += 1
+            if x == width:
+                return x
+        else:
+            count = bits.read(J[state.run_index])
+            cur.extend([run_value] * count)
+            x += count
+            break
+
+    # run interruption sample
+    a, b = run_value, prev[x]
+    ritype, q, k = interruption_params(state, a, b)
+    emerrval = read_golomb(bits, k, LIMIT - J[state.run_index] - 1)
+
+    mapping = (emerrval + ritype) & 1
+    magnitude = (emerrval + ritype + mapping) >> 1
+    if k == 0 and 2 * state.Nn[q] < state.N[q]:
+        errval = magnitude if mapping else -magnitude
+    else:
+        errval = -magnitude if mapping else magnitude
+    update_interruption(state, q, ritype, errval, emerrval)
+    if state.run_index > 0:
+        state.run_index -= 1
+
+    if not ritype and a > b:
+        errval = -errval
+    cur.append(((a if ritype else b) + errval) % RANGE)
+    return x + 1
+
+def read_tga_header(inp) -> Tuple[bytes, int, int]:
+    """:return: (raw header with the image ID, width, height) of an uncompressed 24-bit TGA"""
+    header = inp.read(TGA_HEADER_SIZE)
+    if len(header) < TGA_HEADER_SIZE:
+        raise ValueError('Error: not a TGA file!')
+    if header[2] != 0x02 or header[1] != 0:
+        raise ValueError('Error: only uncompressed true-colour TGA is supported!')
+    if header[16] == 0x20:
+        raise ValueError('Error: RGBA not RGB!')
+    if header[16] != 0x18:
+        raise ValueError('Error: only 24-bit TGA is supported!')
+    width = header[12] + (header[13] << 8)
+    height = header[14] + (header[15] << 8)
+    return header + inp.read(header[0]), width, height
+
+def encode_stream(inp, out):
+    """
+    Format: MAGIC, TGA header length (2 B), TGA header, trailer length (4 B), everything after the pixel data
+    (TGA footer etc.), then the LOCO-I bit stream of all rows, each row coded as its B, G and R lines.
+    Rows are read and coded one at a time.
+    """
+    header, width, height = read_tga_header(inp)
+    data_start = len(header)
+    data_end = data_start + 3 * width * height
+    inp.seek(0, io.SEEK_END)
+    if inp.tell() < data_end:
+        raise ValueError('Error: truncated TGA file!')
+    inp.seek(data_end)
+    trailer = inp.read()
+    inp.seek(data_start)
+
+    out.write(MAGIC)
+    out.write(len(header).to_bytes(2, "big"))
+    out.write(header)
+    out.write(len(trailer).to_bytes(4, "big"))
+    out.write(trailer)
+
+    bits = BitWriter(out)
+    states = [ComponentState() for _ in range(3)]
+    prev = [[0] * width for _ in range(3)]
+    c0 = [0] * 3
+    for _ in range(height if width else 0):
+        row = inp.read(3 * width)
+        for i in range(3):
+            cur = list(row[i::3])
+            encode_row(cur, prev[i], c0[i], states[i], bits)
+            c0[i] = prev[i][0]
+            prev[i] = cur
+    bits.flush()
+
+def decode_stream(inp, out):
+    if inp.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Error: not a LOCO-I file!')
+    header = inp.read(int.from_bytes(inp.read(2), "big"))
+    trailer = inp.read(int.from_bytes(inp.read(4), "big"))
+    width = header[12] + (header[13] << 8)
+    height = header[14] + (header[15] << 8)
+    bits = BitReader(inp.read())
+
+    out.write(header)
+    states = [ComponentState() for _ in range(3)]
+    prev = [[0] * width for _ in range(3)]
+    c0 = [0] * 3
+    for _ in range(height if width else 0):
+        row = bytearray(3 * width)
+        for i in range(3):
+            cur = decode_row(prev[i], c0[i], states[i], bits)
+            row[i::3] = bytes(cur)
+            c0[i] = prev[i][0]
+            prev[i] = cur
+        out.write(row)
+    out.write(trailer)
+
+def encode(input_file: str, output_file: str) -> int:
+    """:return: size of the compressed file in bytes"""
+    with open(input_file, "rb") as inp, open(output_file, "wb") as out:
+        encode_stream(inp, out)
+        return out.tell()
+
+def decode(input_file: str, output_file: str):
+    with open(input_file, "rb") as inp, open(output_file, "wb") as out:
+        decode_stream(inp, out)